@@ -0,0 +1,460 @@
+import math, time, json, os, sys
+import multiprocessing
+from bisect import bisect_right
+import numpy as np
+
+#AI helpers for opencvAirHockey.py, they work on plain numbers so they
+#don't need the game objects
+
+#(maxSpeed, attackSpeed) of every AI difficulty, attack speed is the
+#minimum speed before the AI actively attacks
+difficultySpeeds = { "Mild" : (20, 10),
+                     "Medium" : (25, 20),
+                     "Nightmare" : (30, 30),
+                     "CMU" : (50, 30),
+                     "Predict" : (30, 30),
+                     "Search" : (30, 30),
+                     "Table" : (30, 30) }
+
+#next to this file, so the table is found whatever directory the game runs
+#from
+difficultiesPath = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'difficulties.json')
+
+def loadDifficulties(path=difficultiesPath):
+    #{difficulty : {attribute : value}} written by airHockeyCalibration.py,
+    #empty when the difficulties were never calibrated
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['parameters']
+
+#calibrated settings that MalletAI puts over the hand-picked speeds
+difficultyParameters = loadDifficulties()
+
+def firstTick(test, low, high):
+    #smallest n in low+1..high with test(n) true when test is false up to
+    #some n and true from there on, None if it never gets true
+    if high <= low or not test(high):
+        return None
+    while high - low > 1:
+        middle = (low + high) // 2
+        if test(middle):
+            high = middle
+        else:
+            low = middle
+    return high
+
+class PuckForecast(object):
+    #Where a free puck is n ticks after (x, y, dx, dy), in closed form.
+    #Puck.applyFriction takes friction off the speed keeping the direction
+    #while both components are above friction, and off every component on
+    #its own after that, so the distance covered along each axis in n
+    #ticks is an arithmetic sum either way. puckHitsEdge puts the puck back
+    #on the wall and flips dy, so the path is straight between bounces and
+    #every bounce is found with a binary search on the distance covered,
+    #positions cost O(log bounces) and finding the bounces O(bounces). The
+    #forecast stops at horizon ticks, it never ends without friction.
+    def __init__(self, x, y, dx, dy, friction, height, r, horizon=600):
+        self.x = x
+        self.y = y
+        self.friction = friction
+        self.height = height
+        self.r = r
+        self.signX = 1 if dx >= 0 else -1
+        self.signY = 1 if dy >= 0 else -1
+        self.ax, self.ay = abs(dx), abs(dy)
+        self.speed = math.hypot(dx, dy)
+        self.proportionalTicks = self.countProportional()
+        p = self.proportionalTicks
+        self.axP = self.axisSpeed(self.ax, p)
+        self.ayP = self.axisSpeed(self.ay, p)
+        self.jx = self.axisTicks(self.axP)
+        self.jy = self.axisTicks(self.ayP)
+        self.stopTick = p + max(self.jx, self.jy) + 1
+        self.horizon = min(horizon, self.stopTick)
+        #a forecast that gets to the stop holds for good
+        self.complete = self.stopTick <= horizon
+        self.findBounces()
+
+    def countProportional(self):
+        #ticks friction keeps the direction, until a component gets that low
+        f, smaller = self.friction, min(self.ax, self.ay)
+        if f <= 0 or smaller <= f:
+            #without friction the components never change, which the
+            #component wise formulas handle
+            return 0
+        count = max(0, math.ceil(self.speed / f - self.speed / smaller))
+        #the formula can be one off with rounding, check the ends
+        while count > 0 and self.axisSpeed(smaller, count - 1) <= f:
+            count -= 1
+        while self.axisSpeed(smaller, count) > f:
+            count += 1
+        return count
+
+    def axisSpeed(self, a, n):
+        #speed along an axis after n ticks of direction keeping friction
+        if self.speed == 0:
+            return 0
+        return a * (self.speed - n * self.friction) / self.speed
+
+    def axisTicks(self, a):
+        #ticks a component of a stays above zero once friction works on
+        #every component on its own
+        if self.friction <= 0:
+            return math.inf if a > 0 else 0
+        return max(0, math.ceil(a / self.friction) - 1)
+
+    def travel(self, n, a, aP, j):
+        #distance covered along an axis in the first n ticks
+        f, p = self.friction, self.proportionalTicks
+        if self.speed == 0:
+            return 0
+        first = min(n, p)
+        done = a / self.speed * (first * self.speed -
+                                 f * first * (first + 1) / 2)
+        if n <= p:
+            return done
+        m = min(n - p, j)
+        return done + m * aP - f * m * (m + 1) / 2
+
+    def travelX(self, n):
+        return self.travel(n, self.ax, self.axP, self.jx)
+
+    def travelY(self, n):
+        return self.travel(n, self.ay, self.ayP, self.jy)
+
+    def speedAt(self, n, a, aP, j):
+        p = self.proportionalTicks
+        if n <= p:
+            return self.axisSpeed(a, n)
+        m = n - p
+        return aP - m * self.friction if m <= j else 0
+
+    def findBounces(self):
+        #(tick, y, sign of dy) at the start and after every bounce
+        self.bounces = [(0, self.y, self.signY)]
+        tick, y, sign = 0, self.y, self.signY
+        while True:
+            if sign < 0:
+                room = y - self.r
+            else:
+                room = self.height - self.r - y
+            base = self.travelY(tick)
+            n = firstTick(lambda n: self.travelY(n) - base > room,
+                          tick, self.horizon)
+            if n is None:
+                break
+            tick, sign = n, -sign
+            y = self.r if sign > 0 else self.height - self.r
+            self.bounces.append((tick, y, sign))
+        self.bounceTicks = [tick for tick, y, sign in self.bounces]
+
+    def segment(self, n):
+        #the last bounce at or before tick n
+        return self.bounces[bisect_right(self.bounceTicks, n) - 1]
+
+    def position(self, n):
+        tick, y, sign = self.segment(n)
+        return (self.x + self.signX * self.travelX(n),
+                y + sign * (self.travelY(n) - self.travelY(tick)))
+
+    def velocity(self, n):
+        tick, y, sign = self.segment(n)
+        return (self.signX * self.speedAt(n, self.ax, self.axP, self.jx),
+                sign * self.speedAt(n, self.ay, self.ayP, self.jy))
+
+    def tickAtX(self, lineX):
+        #first tick the puck is at or past lineX, None if it never gets there
+        distance = (lineX - self.x) * self.signX
+        if distance <= 0:
+            return None
+        return firstTick(lambda n: self.travelX(n) >= distance, 0,
+                         self.horizon)
+
+#A game state for searching is one flat list of floats that is only ever
+#written in place, so rolling it forward allocates nothing per tick:
+#puck x, y, dx, dy, then the searching mallet's and the other mallet's
+PUCK, SELF, OTHER = 0, 4, 8
+
+def reboundState(s, m, r, maxSpeed):
+    #Puck.puckRebound on the mallet at index m, in vector form: the polar
+    #angles it works with come down to the components along the line
+    #between the centers and across it
+    dx, dy = s[0] - s[m], s[1] - s[m + 1]
+    d2 = dx * dx + dy * dy
+    if d2 >= 4 * r * r or d2 == 0:
+        return
+    d = math.sqrt(d2)
+    s[0] = s[m] + 2 * r * dx / d
+    s[1] = s[m + 1] + 2 * r * dy / d
+    nx, ny = dx / d, dy / d
+    para = (-(s[2] * nx + s[3] * ny) +
+            2 * (s[m + 2] * nx + s[m + 3] * ny))
+    if para < 0:
+        return
+    perp = ((s[2] * ny - s[3] * nx) + (s[m + 2] * ny - s[m + 3] * nx))
+    s[2] = min(max(para * nx - perp * ny, -maxSpeed), maxSpeed)
+    s[3] = min(max(para * ny + perp * nx, -maxSpeed), maxSpeed)
+
+def frictionState(s, friction):
+    #Puck.applyFriction
+    dx, dy = s[2], s[3]
+    if abs(dx) <= friction or abs(dy) <= friction:
+        if abs(dy) <= friction:
+            s[3] = 0
+        else:
+            s[3] = dy - math.copysign(friction, dy)
+        if abs(dx) <= friction:
+            s[2] = 0
+        else:
+            s[2] = dx - math.copysign(friction, dx)
+    else:
+        k = friction / math.sqrt(dx * dx + dy * dy)
+        s[2] = dx - dx * k
+        s[3] = dy - dy * k
+
+def stepState(s, friction, width, height, r, maxSpeed=50):
+    #one tick of the puck after the mallets moved, in timerFired's order;
+    #returns -1 or 1 when the puck went into the left or right goal
+    reboundState(s, SELF, r, maxSpeed)
+    reboundState(s, OTHER, r, maxSpeed)
+    frictionState(s, friction)
+    s[0] += s[2]
+    s[1] += s[3]
+    if s[0] < 0:
+        return -1
+    elif s[0] > width:
+        return 1
+    if s[1] < r:
+        s[1] = r
+        s[3] = -s[3]
+    elif s[1] > height - r:
+        s[1] = height - r
+        s[3] = -s[3]
+    return 0
+
+class LookaheadSearch(object):
+    #Picks a mallet move by rolling the game forward with every candidate
+    #(standing still, the eight compass directions at full speed and
+    #straight at the puck) held for depth ticks and scoring where that
+    #leaves the puck. Depths go up until the time budget for the tick is
+    #spent, the best move of the deepest finished depth wins, so a slow
+    #tick only makes the search shallower. The rollouts run on one reused
+    #state list.
+    depths = [4, 8, 16, 32, 48]
+
+    def __init__(self, width, height, friction, r, side, maxSpeed,
+                 budget=0.003):
+        self.width = width
+        self.height = height
+        self.friction = friction
+        self.r = r
+        self.side = side #1 when defending the right goal, -1 the left one
+        self.maxSpeed = maxSpeed
+        self.budget = budget #seconds per tick
+        diagonal = maxSpeed / math.sqrt(2)
+        self.moves = [(0, 0), (maxSpeed, 0), (-maxSpeed, 0), (0, maxSpeed),
+                      (0, -maxSpeed), (diagonal, diagonal),
+                      (diagonal, -diagonal), (-diagonal, diagonal),
+                      (-diagonal, -diagonal), None] #None is at the puck
+        self.work = [0.0] * 12
+        if side > 0:
+            self.low, self.high = width / 2 + r, width - r
+        else:
+            self.low, self.high = r, width / 2 - r
+        self.depth = 0 #deepest finished depth of the last search
+
+    def rollout(self, root, move, depth, deadline):
+        #score of holding move for depth ticks, None if time ran out
+        s = self.work
+        s[:] = root
+        r = self.r
+        for tick in range(depth):
+            if move is None:
+                dx, dy = s[0] - s[4], s[1] - s[5]
+                dx = min(max(dx, -self.maxSpeed), self.maxSpeed)
+                dy = min(max(dy, -self.maxSpeed), self.maxSpeed)
+            else:
+                dx, dy = move
+            s[6], s[7] = dx, dy
+            s[4] = min(max(s[4] + dx, self.low), self.high)
+            s[5] = min(max(s[5] + dy, r), self.height - r)
+            goal = stepState(s, self.friction, self.width, self.height, r)
+            if goal != 0:
+                #sooner is better for goals we score, later for the others
+                return (-1000 + tick) if goal == self.side else (1000 - tick)
+            if tick & 7 == 7 and time.perf_counter() > deadline:
+                return None
+            #the other mallet only moves in the first tick
+            s[10] = s[11] = 0
+        return self.evaluate(s)
+
+    def evaluate(self, s):
+        #puck far from our goal and on its way to theirs, and us between
+        #the puck and our goal
+        ownGoalX = self.width if self.side > 0 else 0
+        progress = abs(s[0] - ownGoalX) / self.width
+        speed = -self.side * s[2] / 50
+        guard = -self.side * (s[0] - s[4]) > 0
+        cover = abs(s[5] - s[1]) / self.height
+        return 100 * progress + 30 * speed + (20 if guard else -40) - 10 * cover
+
+    def search(self, root):
+        #(dx, dy) of the best move, never spending much over the budget
+        deadline = time.perf_counter() + self.budget
+        best = self.moves[0]
+        self.depth = 0
+        for depth in self.depths:
+            depthBest, depthScore = None, None
+            for move in self.moves:
+                score = self.rollout(root, move, depth, deadline)
+                if score is None:
+                    return self.resolve(best, root)
+                if depthScore is None or score > depthScore:
+                    depthBest, depthScore = move, score
+            best = depthBest
+            self.depth = depth
+        return self.resolve(best, root)
+
+    def resolve(self, move, root):
+        if move is None:
+            dx = min(max(root[0] - root[4], -self.maxSpeed), self.maxSpeed)
+            dy = min(max(root[1] - root[5], -self.maxSpeed), self.maxSpeed)
+            return dx, dy
+        return move
+
+#Policy tables: the move for every point of a grid over the puck's
+#position and velocity and the AI mallet's position, worked out offline
+#with LookaheadSearch rollouts on a process pool and saved as a .npy file
+#that is memory mapped when playing, so a move costs one lookup. Tables
+#are for the AI defending the right goal, the left side mirrors x. Each
+#has a json header with the physics it was built with, a table is only
+#used when those match the game's. Bump policyVersion whenever the grid
+#or the scoring changes.
+policyVersion = 1
+policyDepth = 16
+
+def policyPaths(difficulty):
+    return f'policy-{difficulty}.npy', f'policy-{difficulty}.json'
+
+def policyPhysics(width, height, friction, r, maxSpeed, puckSpeed=50):
+    return { 'width' : width, 'height' : height, 'friction' : friction,
+             'r' : r, 'maxSpeed' : maxSpeed, 'puckSpeed' : puckSpeed,
+             'depth' : policyDepth }
+
+def policyAxes(physics):
+    #(first, last, count) of puck x, y, dx, dy and mallet x, y
+    width, height, r = physics['width'], physics['height'], physics['r']
+    speed = physics['puckSpeed']
+    return [(0, width, 13), (r, height - r, 7), (-speed, speed, 7),
+            (-speed, speed, 7), (width / 2 + r, width - r, 5),
+            (r, height - r, 7)]
+
+def axisPoints(axis):
+    first, last, count = axis
+    return np.linspace(first, last, count).tolist()
+
+def policyRow(job):
+    #moves for every velocity and mallet position with the puck at one
+    #grid x and y, runs in the pool's processes
+    physics, axes, i, j = job
+    search = LookaheadSearch(physics['width'], physics['height'],
+                             physics['friction'], physics['r'], 1,
+                             physics['maxSpeed'])
+    points = [axisPoints(axis) for axis in axes]
+    row = np.zeros([count for first, last, count in axes[2:]] + [2],
+                   np.float32)
+    root = [0.0] * 12
+    root[0], root[1] = points[0][i], points[1][j]
+    #the other mallet is left off the table
+    root[OTHER] = root[OTHER + 1] = -10 * physics['r']
+    for k, l, m, n in np.ndindex(*row.shape[:4]):
+        root[2], root[3] = points[2][k], points[3][l]
+        root[SELF], root[SELF + 1] = points[4][m], points[5][n]
+        best, bestScore = None, None
+        #ties go to the later moves, so a puck out of reach is chased
+        #rather than waited for
+        for move in reversed(search.moves):
+            score = search.rollout(root, move, physics['depth'], math.inf)
+            if bestScore is None or score > bestScore:
+                best, bestScore = move, score
+        row[k, l, m, n] = search.resolve(best, root)
+    return i, j, row
+
+def buildPolicy(difficulty, width=1280, height=720, friction=0.5, r=50,
+                processes=None):
+    #builds and saves the table for a difficulty, the header goes last so
+    #an interrupted build never gets loaded
+    physics = policyPhysics(width, height, friction, r,
+                            difficultySpeeds[difficulty][0])
+    axes = policyAxes(physics)
+    path, headerPath = policyPaths(difficulty)
+    if os.path.exists(headerPath):
+        os.remove(headerPath)
+    shape = tuple(count for first, last, count in axes) + (2,)
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                      shape=shape)
+    jobs = [(physics, axes, i, j) for i in range(shape[0])
+            for j in range(shape[1])]
+    with multiprocessing.Pool(processes) as pool:
+        for i, j, row in pool.imap_unordered(policyRow, jobs):
+            table[i, j] = row
+    table.flush()
+    del table
+    with open(headerPath, 'w') as f:
+        json.dump({ 'version' : policyVersion, 'difficulty' : difficulty,
+                    'physics' : physics, 'axes' : axes }, f)
+
+class PolicyTable(object):
+    #A built table, memory mapped. A move interpolates the 64 grid points
+    #around the state, their flat indices are the lower corner's plus
+    #offsets that are the same for every state.
+    def __init__(self, table, axes):
+        self.axes = axes
+        self.flat = table.reshape(-1, 2)
+        counts = [count for first, last, count in axes]
+        strides = [int(np.prod(counts[d + 1:])) for d in range(len(counts))]
+        self.strides = np.array(strides)
+        self.corners = np.array(list(np.ndindex(*[2] * len(counts))), bool)
+        self.offsets = self.corners @ self.strides
+        self.low = np.zeros(len(counts), np.intp)
+        self.fraction = np.zeros(len(counts))
+
+    def move(self, state):
+        #(dx, dy) for puck x, y, dx, dy and mallet x, y, right side view
+        for d, (value, (first, last, count)) in enumerate(zip(state,
+                                                              self.axes)):
+            t = (value - first) / (last - first) * (count - 1)
+            t = min(max(t, 0), count - 1)
+            k = min(int(t), count - 2)
+            self.low[d] = k
+            self.fraction[d] = t - k
+        weights = np.prod(np.where(self.corners, self.fraction,
+                                   1 - self.fraction), axis=1)
+        dx, dy = weights @ self.flat[self.offsets + self.low @ self.strides]
+        return float(dx), float(dy)
+
+def loadPolicy(difficulty, width, height, friction, r):
+    #the difficulty's table, or None if it was never built or was built
+    #for other physics or an older version of the grid
+    path, headerPath = policyPaths(difficulty)
+    if not (os.path.exists(path) and os.path.exists(headerPath)):
+        return None
+    with open(headerPath) as f:
+        header = json.load(f)
+    physics = policyPhysics(width, height, friction, r,
+                            difficultySpeeds[difficulty][0])
+    if (header['version'] != policyVersion or header['physics'] != physics
+        or header['axes'] != [list(axis) for axis in policyAxes(physics)]):
+        return None
+    return PolicyTable(np.load(path, mmap_mode='r'), header['axes'])
+
+if __name__ == '__main__':
+    #python3 airHockeyAI.py policy [difficulty], builds a policy table
+    if sys.argv[1:2] == ['policy']:
+        difficulty = sys.argv[2] if len(sys.argv) > 2 else 'Table'
+        start = time.perf_counter()
+        buildPolicy(difficulty)
+        print(f'built {policyPaths(difficulty)[0]} in '
+              f'{time.perf_counter() - start:.1f} s')
@@ -0,0 +1,562 @@
+import sys, os, math, time, json, random, platform, subprocess
+import tkinter
+import numpy as np
+import cv2 as cv
+from airHockeyVision import *
+import opencvAirHockey
+
+#Benchmarks for the vision and game code, run with
+#"python3 airHockeyBenchmark.py <name>", see benchmarks at the bottom
+
+def markerPath(i):
+    #scripted marker center for frame i of a 640x360 synthetic video
+    return (320 + 220 * math.sin(i / 23), 180 + 110 * math.sin(i / 17))
+
+def renderMarkerFrame(marker, i, size=60, occluded=False):
+    #draw the marker on a noisy table at its scripted position
+    frame = np.full((360, 640, 3), 170, np.uint8)
+    cv.randn(frame, (170, 170, 170), (12, 12, 12))
+    cx, cy = markerPath(i)
+    x, y = int(cx - size / 2), int(cy - size / 2)
+    frame[y:y + size, x:x + size] = cv.cvtColor(
+        cv.resize(marker, (size, size), interpolation=cv.INTER_NEAREST),
+        cv.COLOR_GRAY2BGR)
+    if occluded:
+        #a hand passing over the marker
+        cv.circle(frame, (int(cx), int(cy)), size, (60, 90, 140), -1)
+    return frame
+
+def runTracker(tracker, frames, truths, size):
+    #returns mean ms per update and the fraction of frames with a lost
+    #track, i.e. no box or a box whose middle is more than size/2 away
+    lost = 0
+    start = time.perf_counter()
+    for frame, (cx, cy) in zip(frames, truths):
+        ret, bbox = tracker.update(frame)
+        if (not ret or math.hypot(bbox[0] + bbox[2] / 2 - cx,
+                                  bbox[1] + bbox[3] / 2 - cy) > size / 2):
+            lost += 1
+    cost = (time.perf_counter() - start) / len(frames) * 1000
+    return cost, lost / len(frames)
+
+def benchMarkers(count=300, size=60):
+    #aruco marker tracking against CSRT on the same synthetic frames, a
+    #few stretches of frames have the marker covered by a hand
+    marker = drawArucoMarker(getArucoDictionary(), 0, 200)
+    marker = cv.copyMakeBorder(marker, 25, 25, 25, 25, cv.BORDER_CONSTANT,
+                               value=255)
+    frames, truths = [], []
+    for i in range(count + 1):
+        occluded = i % 100 >= 90
+        frames.append(renderMarkerFrame(marker, i, size, occluded))
+        truths.append(markerPath(i))
+    cx, cy = truths[0]
+    bbox = (int(cx - size / 2), int(cy - size / 2), size, size)
+    csrt = cv.TrackerCSRT_create()
+    csrt.init(frames[0], bbox)
+    aruco = ArucoTracker(0)
+    aruco.init(frames[0])
+    results = {'CSRT' : runTracker(csrt, frames[1:], truths[1:], size),
+               'ArUco' : runTracker(aruco, frames[1:], truths[1:], size)}
+    for name in results:
+        cost, lossRate = results[name]
+        print(f'{name:6} {cost:7.2f} ms/frame   lost {lossRate:6.1%}')
+    return results
+
+def renderPaddleFrame(i):
+    #red and blue paddles on a noisy table at 640x360, with their centers
+    frame = np.full((360, 640, 3), 150, np.uint8)
+    cv.randn(frame, (150, 150, 150), (15, 15, 15))
+    red = (160 + 120 * math.sin(i / 19), 180 + 130 * math.sin(i / 13))
+    blue = (480 + 120 * math.sin(i / 21), 180 + 130 * math.cos(i / 11))
+    cv.circle(frame, (int(red[0]), int(red[1])), 22, (30, 30, 210), -1)
+    cv.circle(frame, (int(blue[0]), int(blue[1])), 22, (210, 60, 30), -1)
+    return frame, [red, blue]
+
+def benchColors(count=500):
+    #single pass HSV tracking of two paddles, the target is < 1 ms/frame
+    frames = [renderPaddleFrame(i) for i in range(count)]
+    tracker = ColorTracker(['red', 'blue'])
+    tracker.update(frames[0][0])
+    worst = 0
+    start = time.perf_counter()
+    for frame, truths in frames:
+        ret, boxes = tracker.update(frame)
+        for bbox, (cx, cy) in zip(boxes, truths):
+            worst = max(worst, math.hypot(bbox[0] + bbox[2] / 2 - cx,
+                                          bbox[1] + bbox[3] / 2 - cy))
+    cost = (time.perf_counter() - start) / count * 1000
+    print(f'ColorTracker {cost:6.3f} ms/frame for 2 players at 640x360, '
+          f'worst error {worst:.1f} px')
+    return cost, worst
+
+def pausingPath(moving=2.0, still=2.0):
+    #a disc that moves for a while and then stays put, over and over
+    wave = wavePath(0.75, 0.5, 0.18, 0.35, 3.1, 2.3)
+    def path(t):
+        cycle = moving + still
+        return wave(t // cycle * moving + min(t % cycle, moving))
+    return path
+
+def benchMotion(count=360):
+    #a FlowTracker with and without a MotionGate on a disc that is still
+    #half the time, the gated one should skip about that many updates
+    source = SyntheticSource([Disc((30, 30, 210), pausingPath())],
+                             realTime=False)
+    mapper = FrameMapper(640, 360)
+    frames, truths = [], []
+    for i in range(count + 1):
+        ret, frame = source.read()
+        frames.append(mapper.prepare(frame))
+        x, y, w, h = source.truthBoxes(mapper)[0]
+        truths.append((x + w / 2, y + h / 2))
+    size = 2 * source.discs[0].radius * 360
+    x, y = truths[0]
+    bbox = (int(x - size / 2), int(y - size / 2), int(size), int(size))
+    results = {}
+    for name, tracker in [('FlowTracker', FlowTracker()),
+                          ('MotionGate', MotionGate(FlowTracker()))]:
+        tracker.init(frames[0], bbox)
+        results[name] = runTracker(tracker, frames[1:], truths[1:], size)
+        cost, lossRate = results[name]
+        print(f'{name:11} {cost:7.2f} ms/frame   lost {lossRate:6.1%}')
+    print(f'MotionGate skipped {tracker.skipped} of {count} updates')
+    return results
+
+def benchTargets(ticks=3000):
+    #practice hit checks per tick, every rectangle in turn against the
+    #TargetIndex, on brick walls of more and more targets; both see the same
+    #pucks and so clear the same bricks
+    rng = random.Random(0)
+    pucks = [(rng.uniform(0, 1280), rng.uniform(50, 670),
+              rng.uniform(-50, 50), rng.uniform(-50, 50))
+             for i in range(ticks)]
+    walls = [(1, 32, 60, 10), (9, 32, 20, 10), (10, 32, 4, 3),
+             (20, 16, 4, 3)] #columns, spacing, brick length, gap
+    results = {}
+    for columns, spacing, length, gap in walls:
+        level = opencvAirHockey.brickLevel(0, 720, columns, spacing, length,
+                                           gap, missing=0)
+        costs = []
+        for indexed in [False, True]:
+            rectangles = [opencvAirHockey.Rectangle(640 + offset, 'Left', 720,
+                                                    y, brick)
+                          for offset, y, brick in level]
+            targets = opencvAirHockey.TargetIndex(rectangles, 'Left', 720)
+            start = time.perf_counter()
+            for x, y, dx, dy in pucks:
+                puck = opencvAirHockey.Puck(x, y, dx, dy)
+                if indexed:
+                    targets.puckHits(puck)
+                else:
+                    for rectangle in rectangles:
+                        rectangle.puckHits(puck)
+            costs.append((time.perf_counter() - start) / ticks * 1e6)
+        results[len(level)] = costs
+        print(f'{len(level):5} targets   every rectangle {costs[0]:8.2f} us/tick'
+              f'   TargetIndex {costs[1]:6.2f} us/tick')
+    return results
+
+def benchParty(ticks=300, counts=(10, 50, 100, 200), r=15):
+    #party mode physics for more and more pucks, through the PuckGrid and
+    #testing every pair, against a tick at the physics rate; goals put the
+    #puck back in the middle like PartyMode.checkEdge
+    budget = 1000 / opencvAirHockey.physicsRate
+    results = {}
+    for count in counts:
+        costs = []
+        for grid in [opencvAirHockey.PuckGrid(2 * r), None]:
+            rng = random.Random(count)
+            pucks = [opencvAirHockey.Puck(rng.uniform(r, 1280 - r),
+                                          rng.uniform(r, 720 - r),
+                                          rng.uniform(-20, 20),
+                                          rng.uniform(-20, 20), r)
+                     for i in range(count)]
+            mallets = [opencvAirHockey.Mallet(320, 360, 0, 0),
+                       opencvAirHockey.Mallet(960, 360, 0, 0)]
+            start = time.perf_counter()
+            for tick in range(ticks):
+                for i, mallet in enumerate(mallets):
+                    #the mallets sweep their halves in circles
+                    angle = tick / 20 + i * math.pi
+                    x = 320 + 640 * i + 200 * math.cos(angle)
+                    y = 360 + 200 * math.sin(angle)
+                    mallet.dx, mallet.dy = x - mallet.x, y - mallet.y
+                    mallet.x, mallet.y = x, y
+                opencvAirHockey.stepPucks(pucks, mallets, 0.5, grid)
+                for puck in pucks:
+                    if puck.x < 0 or puck.x > 1280:
+                        puck.x, puck.y = 640, rng.uniform(r, 720 - r)
+                        puck.dx, puck.dy = 0, 0
+                    puck.puckHitsEdge(720)
+            costs.append((time.perf_counter() - start) / ticks * 1000)
+        results[count] = costs
+        print(f'{count:4} pucks   PuckGrid {costs[0]:6.2f} ms/tick   '
+              f'every pair {costs[1]:7.2f} ms/tick   '
+              f'budget {budget:.1f} ms')
+    return results
+
+def dictBacked(cls):
+    #the same class without its __slots__, so every instance gets a
+    #__dict__ the way the entities had one before
+    slots = getattr(cls, '__slots__', ())
+    methods = { name : value for name, value in vars(cls).items()
+                if name not in slots and
+                name not in ('__slots__', '__dict__', '__weakref__') }
+    return type(cls.__name__, (object,), methods)
+
+def entitySize(entity):
+    #bytes of an entity and of its __dict__ when it has one
+    size = sys.getsizeof(entity)
+    if hasattr(entity, '__dict__'):
+        size += sys.getsizeof(entity.__dict__)
+    return size
+
+def rally(Puck, Mallet, ticks, seed=0):
+    #two player mode's physics with both mallets chasing the puck in their
+    #halves, the puck goes back to the middle after a goal
+    rng = random.Random(seed)
+    puck = Puck(640, 360, rng.uniform(-20, 20), rng.uniform(-20, 20))
+    mallets = [Mallet(100, 360, 0, 0), Mallet(1180, 360, 0, 0)]
+    start = time.perf_counter()
+    for tick in range(ticks):
+        for i, mallet in enumerate(mallets):
+            x, y = mallet.x, mallet.y
+            if (puck.x < 640) == (i == 0):
+                mallet.move(puck.x, puck.y)
+            else:
+                mallet.move(100 + 1080 * i, 360)
+            mallet.fixPosition(640 * i, 640 * (i + 1), 720)
+            mallet.dx, mallet.dy = mallet.x - x, mallet.y - y
+        puck.puckRebound(mallets[0])
+        puck.puckRebound(mallets[1])
+        puck.applyFriction(0.5)
+        puck.move()
+        if puck.x < 0 or puck.x > 1280:
+            puck.x, puck.y = 640, 360
+            puck.dx, puck.dy = rng.uniform(-20, 20), rng.uniform(-20, 20)
+        puck.puckHitsEdge(720)
+    return (time.perf_counter() - start) / ticks * 1e6, puck
+
+def benchEntities(ticks=50000, reads=250000, repeats=5):
+    #the entities with __slots__ against the same classes with a __dict__:
+    #bytes per entity, reading a puck's x, y, dx, dy, and a simulated tick,
+    #the best of a few repeats
+    results = {}
+    for name, Puck, Mallet in [('__dict__',
+                                dictBacked(opencvAirHockey.Puck),
+                                dictBacked(opencvAirHockey.Mallet)),
+                               ('__slots__', opencvAirHockey.Puck,
+                                opencvAirHockey.Mallet)]:
+        puck = Puck(640, 360, 3, 4)
+        read = tick = math.inf
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            for i in range(reads):
+                puck.x, puck.y, puck.dx, puck.dy
+            read = min(read, (time.perf_counter() - start) / reads * 1e9)
+        for repeat in range(repeats):
+            cost, puck = rally(Puck, Mallet, ticks)
+            tick = min(tick, cost)
+        results[name] = { 'puckBytes' : entitySize(puck),
+                          'malletBytes' : entitySize(Mallet(0, 0, 0, 0)),
+                          'readNs' : read,
+                          'tickUs' : tick,
+                          'end' : (puck.x, puck.y, puck.dx, puck.dy) }
+        print(f"{name:9}   puck {results[name]['puckBytes']:4} B   "
+              f"mallet {results[name]['malletBytes']:4} B   "
+              f"4 reads {read:6.1f} ns   tick {tick:6.2f} us")
+    #both kinds play the same rally
+    assert results['__dict__']['end'] == results['__slots__']['end']
+    return results
+
+class RecordingCanvas(object):
+    #stands in for the Tk canvas when there is no display, the drawing
+    #calls are only counted so redrawAll can still be timed
+    def __init__(self):
+        self.inRedrawAll = False
+        self.calls = 0
+
+    def record(self, *args, **kwargs):
+        self.calls += 1
+
+    create_arc = create_image = create_line = create_oval = record
+    create_polygon = create_rectangle = create_text = record
+
+    def delete(self, *args):
+        pass
+
+    def update(self):
+        pass
+
+def hasDisplay():
+    return (sys.platform in ('win32', 'darwin') or
+            os.environ.get('DISPLAY') is not None)
+
+class Event(object):
+    #the parts of a Tk event the modes look at
+    def __init__(self, x=0, y=0, key=None):
+        self.x = x
+        self.y = y
+        self.key = key
+
+class GameDriver(object):
+    #Runs MyModalApp without Tk's mainloop so it can be scripted and timed:
+    #mouse and key events go straight to the active mode and a tick is
+    #timerFired followed by a redraw. Under a display (a virtual one like
+    #xvfb-run works too) the redraw goes to a real Tk canvas, headless it
+    #goes to a RecordingCanvas and screens with images aren't drawn.
+    #Matches are only recorded when given a replays directory.
+    def __init__(self, frameSource='synthetic:fast', width=1280, height=720,
+                 replays=None):
+        self.app = opencvAirHockey.MyModalApp(width=width, height=height,
+                                frameSource=frameSource, showCamera=False,
+                                replays=replays, autorun=False)
+        if hasDisplay():
+            self.root = tkinter.Tk()
+            self.canvas = tkinter.Canvas(self.root, width=width,
+                                         height=height)
+            self.canvas.pack()
+            self.canvas.inRedrawAll = False
+        else:
+            self.root = None
+            self.canvas = RecordingCanvas()
+        self.app._canvas = self.canvas #loadImage checks it
+        self.app.appStarted()
+        self.activate()
+
+    @property
+    def mode(self):
+        return self.app._activeMode
+
+    def activate(self):
+        #start a newly active mode, the app isn't running so this skips the
+        #redraw startActiveMode would do
+        if not self.mode._appStartedCalled:
+            self.app.startActiveMode()
+
+    def click(self, x, y):
+        self.app.mousePressed(Event(x, y))
+        self.activate()
+
+    def press(self, key):
+        self.app.keyPressed(Event(key=key))
+        self.activate()
+
+    def tick(self, draw=True):
+        #returns the seconds spent in timerFired and in the redraw, and the
+        #time the redraw finished at
+        start = time.perf_counter()
+        self.app.timerFired()
+        fired = time.perf_counter()
+        if draw:
+            self.canvas.delete('all')
+            self.app.redrawAll(self.canvas)
+            self.canvas.update()
+            self.app.probe.finish()
+        end = time.perf_counter()
+        return fired - start, end - fired, end
+
+    def close(self):
+        if getattr(self.mode, 'cap', None) is not None:
+            self.mode.cap.release()
+        opencvAirHockey.stopRecording(self.mode)
+        if self.app.replayWriter is not None:
+            self.app.replayWriter.close()
+        if self.root is not None:
+            self.root.destroy()
+
+difficulties = ['Mild', 'Medium', 'Nightmare', 'CMU', 'Predict', 'Search',
+                'Table']
+#where the buttons are on the selection screen, from (width/4, height/4+100)
+difficultyButtons = { 'Mild' : (0, 0), 'Medium' : (0, 100),
+                      'Nightmare' : (0, 200), 'CMU' : (0, 300),
+                      'Predict' : (220, 0), 'Search' : (220, 100),
+                      'Table' : (220, 200) }
+
+def enterMode(driver, name, difficulty=None):
+    #click through the splash screen and the selection screens
+    w, h = driver.app.width, driver.app.height
+    if name == 'TwoPlayer':
+        driver.click(w/4, h * 2/5)
+    elif name == 'OnePlayer':
+        driver.click(w/4 + 180, h * 3/5)
+        selectOnePlayer(driver, difficulty)
+    elif name == 'Practice':
+        driver.click(w/4 + 360, h * 4/5)
+        selectPractice(driver)
+    elif name == 'Party':
+        driver.click(w/4 + 540, h * 2/5)
+
+def selectOnePlayer(driver, difficulty):
+    w, h = driver.app.width, driver.app.height
+    dx, dy = difficultyButtons[difficulty]
+    driver.click(w/4 + 10 + dx, h/4 + 110 + dy)
+    driver.click(w/4 * 3 + 10, h/4 + 110) #left hand
+    driver.click(w - 60, h - 60) #go
+    driver.tick(draw=False)
+
+def selectPractice(driver):
+    w, h = driver.app.width, driver.app.height
+    driver.click(w/3, h/2 + 10) #left hand
+    driver.click(w - 60, h - 60) #go
+    driver.tick(draw=False)
+
+def inGame(mode):
+    return getattr(mode, 'tracked', False) and getattr(mode, 'selected', True)
+
+def gameOver(mode):
+    return getattr(mode, 'done', False) or getattr(mode, 'won', False) or (
+           getattr(mode, 'lost', False))
+
+def runGame(name, difficulty=None, ticks=300, frameSource='synthetic:fast'):
+    #Plays one mode with the synthetic camera and times every game tick.
+    #Input to photon is from the capture of the frame a tick used to the
+    #end of the redraw that shows it. Finished games are restarted with 'n'.
+    #None when the difficulty can't be picked, Table without its table.
+    driver = GameDriver(frameSource)
+    enterMode(driver, name, difficulty)
+    if not getattr(driver.mode, 'selected', True):
+        driver.close()
+        return None
+    draw = isinstance(driver.canvas, tkinter.Canvas)
+    while not inGame(driver.mode):
+        driver.tick(draw)
+    timers, trackers, redraws, latencies = [], [], [], []
+    start = time.perf_counter()
+    for i in range(ticks):
+        mode = driver.mode
+        frames = mode.cap.frameCount
+        mode.trackerTime = None
+        timer, redraw, end = driver.tick()
+        timers.append(timer)
+        redraws.append(redraw)
+        if mode.trackerTime is not None:
+            trackers.append(mode.trackerTime)
+        if mode.cap.frameCount != frames:
+            latencies.append(end - mode.cap.captureTime)
+        if gameOver(mode):
+            driver.press('n')
+            if name == 'OnePlayer':
+                selectOnePlayer(driver, difficulty)
+            elif name == 'Practice':
+                selectPractice(driver)
+            while not inGame(driver.mode):
+                driver.tick(draw)
+    elapsed = time.perf_counter() - start
+    latencyBreakdown = driver.app.probe.report()
+    qualityLevel = driver.app.quality.level
+    driver.close()
+    return { 'mode' : name,
+             'difficulty' : difficulty,
+             'ticks' : ticks,
+             'ticksPerSecond' : ticks / elapsed,
+             'qualityLevel' : qualityLevel,
+             'timerFired' : percentiles(timers),
+             'tracker' : percentiles(trackers),
+             'redraw' : percentiles(redraws),
+             'inputToPhoton' : percentiles(latencies),
+             'latencyBreakdown' : latencyBreakdown }
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def benchGame(ticks=300, out='benchmark_results.json'):
+    #every mode and difficulty end to end, results go to a json file that
+    #"python3 airHockeyBenchmark.py compare old.json new.json" can compare
+    configs = ([('TwoPlayer', None)] +
+               [('OnePlayer', difficulty) for difficulty in difficulties] +
+               [('Practice', None), ('Party', None)])
+    results = []
+    for name, difficulty in configs:
+        result = runGame(name, difficulty, ticks)
+        if result is None:
+            print(f"{name:9} {difficulty or '':9} skipped, can't be picked")
+            continue
+        results.append(result)
+        latency = result['inputToPhoton']
+        print(f"{name:9} {difficulty or '':9} "
+              f"{result['ticksPerSecond']:7.1f} ticks/s   "
+              f"redraw p50 {result['redraw']['p50']:6.2f} ms   "
+              f"tracker p50 {result['tracker']['p50']:6.2f} ms   "
+              f"latency p50/p99 {latency['p50']:6.2f}/{latency['p99']:6.2f} ms")
+    report = { 'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'commit' : gitCommit(),
+               'python' : platform.python_version(),
+               'opencv' : cv.__version__,
+               'platform' : platform.platform(),
+               'display' : hasDisplay(),
+               'results' : results }
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'results written to {out}')
+    return report
+
+def compareResults(oldPath, newPath, tolerance=0.1):
+    #list every median time or tick rate that got worse by more than
+    #tolerance between two benchGame result files
+    with open(oldPath) as f:
+        old = json.load(f)
+    with open(newPath) as f:
+        new = json.load(f)
+    oldResults = {(r['mode'], r['difficulty']) : r for r in old['results']}
+    regressions = []
+    for result in new['results']:
+        key = (result['mode'], result['difficulty'])
+        if key not in oldResults:
+            continue
+        before = oldResults[key]
+        if result['ticksPerSecond'] < before['ticksPerSecond'] * (1 - tolerance):
+            regressions.append((key, 'ticksPerSecond',
+                                before['ticksPerSecond'],
+                                result['ticksPerSecond']))
+        for metric in ['timerFired', 'tracker', 'redraw', 'inputToPhoton']:
+            if before[metric] is None or result[metric] is None:
+                continue
+            if result[metric]['p50'] > before[metric]['p50'] * (1 + tolerance):
+                regressions.append((key, metric + ' p50',
+                                    before[metric]['p50'],
+                                    result[metric]['p50']))
+    for (name, difficulty), metric, before, after in regressions:
+        print(f"regression {name} {difficulty or ''} {metric}: "
+              f"{before:.2f} -> {after:.2f}")
+    if len(regressions) == 0:
+        print('no regressions')
+    return regressions
+
+def benchLatency(ticks=300):
+    #where the time between a frame's capture and its redraw goes, per mode,
+    #with the mouse as the baseline without any vision
+    modes = [('TwoPlayer', None), ('OnePlayer', 'Medium'), ('Practice', None)]
+    runs = [(frameSource, name, difficulty)
+            for frameSource in ['synthetic:fast', 'mouse']
+            for name, difficulty in modes]
+    for frameSource, name, difficulty in runs:
+        result = runGame(name, difficulty, ticks, frameSource)
+        print(f"{name} {difficulty or ''} ({frameSource})")
+        for stage, summary in result['latencyBreakdown'].items():
+            if summary is not None:
+                print(f"  {stage:8} p50 {summary['p50']:7.2f}   "
+                      f"p90 {summary['p90']:7.2f}   "
+                      f"p99 {summary['p99']:7.2f} ms")
+
+benchmarks = { 'markers' : benchMarkers,
+               'colors' : benchColors,
+               'motion' : benchMotion,
+               'targets' : benchTargets,
+               'party' : benchParty,
+               'entities' : benchEntities,
+               'game' : benchGame,
+               'latency' : benchLatency }
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['compare']:
+        sys.exit(1 if compareResults(sys.argv[2], sys.argv[3]) else 0)
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        print(f'== {name}')
+        benchmarks[name]()
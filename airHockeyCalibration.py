@@ -0,0 +1,138 @@
+import math, time, json, argparse, itertools
+import multiprocessing
+from airHockeyAI import difficultiesPath
+from airHockeyTournament import playMatch, entrantName, ticksPerMinute
+
+#Sets the MalletAI difficulties by simulation instead of by hand, run with
+#"python3 airHockeyCalibration.py". Every combination in parameterGrid
+#plays one minute matches against the reference opponents on a process
+#pool, on both sides and with several seeds. Each difficulty then gets the
+#combination whose share of the goals comes closest to its targets, and
+#the table goes to difficulties.json, which MalletAI reads. The table is
+#not kept in git, the hand-picked speeds stay the default.
+
+#settings to search, another MalletAI attribute only needs a line here.
+#None of them may switch a behaviour off, an attackSpeed of 0 would be a
+#mallet that never attacks.
+parameterGrid = { 'maxSpeed' : list(range(10, 55, 5)),
+                  'attackSpeed' : list(range(5, 55, 5)) }
+#opponents that stay the same whatever the table says: the hand-picked
+#Nightmare and the predictive AI
+references = [('Nightmare', (('maxSpeed', 30), ('attackSpeed', 30))),
+              'Predict']
+#share of the goals every difficulty should score against each reference,
+#in the order of references
+targets = { 'Mild' : [0.2, 0.2],
+            'Medium' : [0.35, 0.35],
+            'Nightmare' : [0.5, 0.5],
+            'CMU' : [0.7, 0.7] }
+#goals a candidate needs against every reference before its shares count,
+#a handful of goals says more about the seeds than about the settings
+minGoals = 20
+
+def candidates():
+    #every combination of the grid, as tournament entrants
+    names = list(parameterGrid)
+    return [('Mild', tuple(zip(names, values)))
+            for values in itertools.product(*parameterGrid.values())]
+
+def calibrationJobs(entrants, seeds, seed):
+    #(candidate, reference) for every job, and the jobs
+    keys, jobs = [], []
+    for candidate in entrants:
+        for reference in references:
+            for i in range(seeds):
+                for left, right in [(candidate, reference),
+                                    (reference, candidate)]:
+                    keys.append((candidate, reference))
+                    jobs.append((len(jobs), left, right,
+                                 seed * 1000003 + len(jobs), math.inf,
+                                 ticksPerMinute))
+    return keys, jobs
+
+def goalShares(keys, results):
+    #{candidate : [share of the goals it scored against each reference]}
+    #and {candidate : [goals against each reference]}, the shares count one
+    #extra goal for each side so few goals pull them towards 0.5 instead
+    #of 0 or 1
+    goals = {}
+    for index, left, right, scores, *rest in results:
+        candidate, reference = keys[index]
+        mine, theirs = scores if left == candidate else scores[::-1]
+        entry = goals.setdefault(candidate, {})
+        scored, conceded = entry.get(reference, (0, 0))
+        entry[reference] = (scored + mine, conceded + theirs)
+    shares, totals = {}, {}
+    for candidate, entry in goals.items():
+        shares[candidate], totals[candidate] = [], []
+        for reference in references:
+            scored, conceded = entry[reference]
+            total = scored + conceded
+            shares[candidate].append((scored + 1) / (total + 2))
+            totals[candidate].append(total)
+    return shares, totals
+
+def pickParameters(entrants, shares, totals):
+    #{difficulty : candidate} closest to the targets, the first one of the
+    #grid order on ties. Candidates with fewer than minGoals goals against
+    #any reference have no share to go by and are left out.
+    entrants = [candidate for candidate in entrants
+                if min(totals[candidate]) >= minGoals]
+    if not entrants:
+        raise ValueError(f'no candidate had {minGoals} goals against every '
+                         'reference, play more seeds')
+    picks = {}
+    for difficulty, target in targets.items():
+        def error(candidate):
+            return sum((share - goal) ** 2 for share, goal in
+                       zip(shares[candidate], target))
+        picks[difficulty] = min(entrants, key=error)
+    return picks
+
+def calibrate(seeds=12, seed=0, processes=None, out=difficultiesPath):
+    entrants = candidates()
+    keys, jobs = calibrationJobs(entrants, seeds, seed)
+    processes = processes or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = list(pool.imap_unordered(playMatch, jobs,
+                       chunksize=max(1, len(jobs) // (8 * processes))))
+    elapsed = time.perf_counter() - start
+    shares, totals = goalShares(keys, results)
+    picks = pickParameters(entrants, shares, totals)
+    table = { 'generated' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'seed' : seed,
+              'seeds' : seeds,
+              'references' : [entrantName(r) for r in references],
+              'targets' : targets,
+              'minGoals' : minGoals,
+              'parameters' : { difficulty : dict(candidate[1])
+                               for difficulty, candidate in picks.items() },
+              'shares' : { difficulty : shares[candidate]
+                           for difficulty, candidate in picks.items() },
+              'goals' : { difficulty : totals[candidate]
+                          for difficulty, candidate in picks.items() } }
+    with open(out, 'w') as f:
+        json.dump(table, f, indent=2)
+    for difficulty, candidate in picks.items():
+        settings = ' '.join(f'{attribute}={value}'
+                            for attribute, value in candidate[1])
+        got = ' '.join(f'{share:.2f}' for share in shares[candidate])
+        want = ' '.join(f'{share:.2f}' for share in targets[difficulty])
+        print(f'{difficulty:10} {settings:30} shares {got}   target {want}'
+              f'   goals {" ".join(map(str, totals[candidate]))}')
+    ticks = sum(result[4] for result in results)
+    print(f'{len(jobs)} matches in {elapsed:.1f} s, '
+          f'{ticks / elapsed:.0f} simulated ticks/s, table written to {out}')
+    return table
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='calibrate the AI '
+                                     'difficulties by simulated matches')
+    parser.add_argument('--seeds', type=int, default=12,
+                        help='matches per candidate, reference and side')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--out', default=difficultiesPath)
+    args = parser.parse_args()
+    calibrate(args.seeds, args.seed, args.processes, args.out)
@@ -0,0 +1,120 @@
+import time
+import numpy as np
+from airHockeyVision import FrameSource, PreparedMapper
+
+#Mouse and keyboard in place of the camera, for playing without one and as
+#the zero latency baseline the vision pipeline is measured against. They
+#are frame sources that track by themselves, so the modes get the mallet
+#positions through RemoteTrackers the same way they get a vision process's,
+#and the positions go through Mallet.track and fixMalletSpeed like any
+#tracked ones.
+
+class InputState(object):
+    #what the app saw of the mouse and keyboard, fed by MyModalApp's
+    #event handlers
+    def __init__(self):
+        self.mouse = None
+        self.mouseTime = None
+        self.held = set()
+
+    def mouseMoved(self, x, y):
+        self.mouse = (x, y)
+        self.mouseTime = time.perf_counter()
+
+    def keyPressed(self, key):
+        self.held.add(key)
+
+    def keyReleased(self, key):
+        self.held.discard(key)
+
+class InputSource(FrameSource):
+    #Base of the controllers: the frames are blank and window sized, so the
+    #boxes read() leaves in boxes are in window pixels, small squares
+    #around where every player's mallet should go
+    remote = True
+
+    def __init__(self, inputState, players=2, boxSize=20):
+        super().__init__(realTime=False)
+        self.input = inputState
+        self.boxSize = boxSize
+        self.boxes = [None] * players
+        self.found = [False] * players
+        self.size = None
+        self.frame = None
+
+    def makeMapper(self, width, height, size):
+        self.size = (width, height)
+        self.frame = np.zeros((height, width, 3), np.uint8)
+        return PreparedMapper(width, height, self.size)
+
+    def setPoint(self, player, x, y):
+        r = self.boxSize / 2
+        self.boxes[player] = (x - r, y - r, self.boxSize, self.boxSize)
+        self.found[player] = True
+
+    def read(self):
+        self.frameCount += 1
+        self.timestamp = self.poll()
+        return True, self.frame
+
+    def poll(self):
+        #update the boxes, returns the time they are from
+        raise NotImplementedError
+
+class MouseControl(InputSource):
+    #every player's mallet goes where the mouse is
+    def __init__(self, inputState, players=2, boxSize=20):
+        super().__init__(inputState, players, boxSize)
+        self.lastMouseTime = None
+
+    def poll(self):
+        if self.input.mouse is None:
+            #the mallets wait on their own side until the mouse shows up
+            width, height = self.size
+            for player in range(len(self.boxes)):
+                self.setPoint(player, width * (2 * player + 1) / 4, height / 2)
+            return time.perf_counter()
+        for player in range(len(self.boxes)):
+            self.setPoint(player, *self.input.mouse)
+        if self.input.mouseTime != self.lastMouseTime:
+            #a new position is from when the mouse moved there
+            self.lastMouseTime = self.input.mouseTime
+            return self.input.mouseTime
+        #no news means the mallet stayed where it was until now
+        return time.perf_counter()
+
+class KeyboardControl(InputSource):
+    #w/a/s/d move the left player's mallet and the arrow keys the right
+    #player's, speed in window pixels per second
+    keys = [ {'w' : (0, -1), 'a' : (-1, 0), 's' : (0, 1), 'd' : (1, 0)},
+             {'Up' : (0, -1), 'Left' : (-1, 0), 'Down' : (0, 1),
+              'Right' : (1, 0)} ]
+
+    def __init__(self, inputState, players=2, boxSize=20, speed=1200):
+        super().__init__(inputState, players, boxSize)
+        self.speed = speed
+        self.points = None
+        self.lastPoll = None
+
+    def poll(self):
+        now = time.perf_counter()
+        width, height = self.size
+        if self.points is None:
+            self.points = [(width * (2 * player + 1) / 4, height / 2)
+                           for player in range(len(self.boxes))]
+        dt = 0 if self.lastPoll is None else now - self.lastPoll
+        self.lastPoll = now
+        for player, (x, y) in enumerate(self.points):
+            dx = dy = 0
+            for key, (kx, ky) in self.keys[player % 2].items():
+                if key in self.input.held:
+                    dx += kx
+                    dy += ky
+            x = min(max(x + dx * self.speed * dt, 0), width)
+            y = min(max(y + dy * self.speed * dt, 0), height)
+            self.points[player] = (x, y)
+            self.setPoint(player, x, y)
+        return now
+
+controls = { 'mouse' : MouseControl,
+             'keys' : KeyboardControl }
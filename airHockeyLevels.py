@@ -0,0 +1,224 @@
+import math, time, json, os, random, argparse
+import multiprocessing
+from airHockeyAI import frictionState
+
+#Practice levels: a level is made from a seed and a grade, the grade sets
+#how many targets there are and how short they get. Levels are verified by
+#a solver that plays shots from the mallet's side on plain numbers, the way
+#PracticeMode.timerFired moves the puck, one target per shot since a hit
+#sends the puck back. How hard a level is is measured as the share of the
+#shots that get a target on the way the solver cleared it, a grade only
+#keeps levels below its easiest share, so an easy layout drawn by chance
+#doesn't end up in a hard grade. "python3 airHockeyLevels.py" verifies
+#seeds on a process pool and keeps the solvable ones in levels.json, the
+#game hands those out so a new level is there the moment 'n' is pressed.
+#Levels are worked out for the left hand, the right hand's is the mirror
+#image. After the last grade comes a brick wall of hundreds of small
+#targets, which is clearable one brick at a time by the way it's laid out.
+
+levelsPath = 'levels.json'
+levelVersion = 1
+#(targets, shortest, longest, easiest share of useful shots) for every
+#grade, easiest first
+levelGrades = [(6, 250, 360, 1.0), (8, 200, 330, 0.74), (10, 150, 360, 0.66),
+               (10, 110, 220, 0.61), (10, 70, 140, 0.56)]
+targetSpacing = 64
+brickGrade = len(levelGrades)
+
+def generateLevel(seed, grade, height):
+    #[(offset, y, length)] of the targets, offset is how far past the
+    #middle line a target is
+    count, shortest, longest, easiest = levelGrades[grade]
+    rng = random.Random(seed)
+    level = []
+    for column in range(count):
+        length = rng.randint(shortest, min(longest, height))
+        level.append((column * targetSpacing,
+                      rng.randint(0, height - length), length))
+    return level
+
+def brickLevel(seed, height, columns=18, spacing=32, length=20, gap=10,
+               missing=0.1):
+    #a wall of small targets, with a few left out at random; the nearest
+    #brick in the puck's way can always be hit, so it is always clearable
+    rng = random.Random(seed)
+    level = []
+    for column in range(columns):
+        for y in range(0, height - length + 1, length + gap):
+            if rng.random() >= missing:
+                level.append((column * spacing, y, length))
+    return level
+
+def shotDirections(speeds=(20, 35, 50), angles=13, spread=math.pi / 3):
+    #the shots the solver tries, all toward the targets
+    shots = []
+    for speed in speeds:
+        for i in range(angles):
+            angle = -spread + 2 * spread * i / (angles - 1)
+            shots.append((speed * math.cos(angle), speed * math.sin(angle)))
+    return shots
+
+class LevelSolver(object):
+    #Plays a level one shot at a time, trying every shot from where the
+    #puck can be hit and going deeper with every shot that clears a target
+    #and brings the puck back, until all are cleared or maxNodes positions
+    #have been tried
+    def __init__(self, width, height, friction=0.5, r=50, maxSpeed=50,
+                 maxNodes=300, maxTicks=600):
+        self.width = width
+        self.height = height
+        self.friction = friction
+        self.r = r
+        self.maxSpeed = maxSpeed
+        self.maxNodes = maxNodes
+        self.maxTicks = maxTicks
+        self.shots = shotDirections()
+
+    def shoot(self, x, y, dx, dy, targets, remaining):
+        #(target hit or None, x, y where the puck can be hit next), None
+        #when the shot loses the level
+        s = [x, y, dx, dy]
+        r, width, height = self.r, self.width, self.height
+        hit = None
+        for tick in range(self.maxTicks):
+            if s[2] > 0:
+                #Rectangle.puckHits, the first one hit sends the puck back
+                for k in remaining:
+                    targetX, targetY, length = targets[k]
+                    if (s[0] + r >= targetX and
+                        targetY - 20 < s[1] < targetY + length + 20):
+                        s[2] = -s[2]
+                        hit = k
+                        break
+            frictionState(s, self.friction)
+            s[0] += s[2]
+            s[1] += s[3]
+            #PracticeMode.checkEdge
+            if s[0] < 0 or s[0] > width:
+                return None
+            if s[0] >= width / 2 + r and s[2] == 0:
+                return None
+            if s[1] < r:
+                s[1], s[3] = r, -s[3]
+            elif s[1] > height - r:
+                s[1], s[3] = height - r, -s[3]
+            s[2] = min(max(s[2], -self.maxSpeed), self.maxSpeed)
+            s[3] = min(max(s[3], -self.maxSpeed), self.maxSpeed)
+            if s[2] <= 0 and s[0] <= width / 2 - 2 * r:
+                #back where the mallet gets it
+                return hit, s[0], s[1]
+            if s[2] == 0 and s[3] == 0:
+                return hit, s[0], s[1]
+        return None
+
+    def solve(self, level):
+        #[(shot, share of the shots that would have got a target there)]
+        #that clear the level, None if none were found
+        targets = [(self.width / 2 + offset, y, length)
+                   for offset, y, length in level]
+        self.nodes = 0
+        self.seen = set()
+        return self.search(self.width / 4, self.height / 2, targets,
+                           tuple(range(len(targets))))
+
+    def search(self, x, y, targets, remaining):
+        if len(remaining) == 0:
+            return []
+        key = (round(x), round(y), remaining)
+        if self.nodes >= self.maxNodes or key in self.seen:
+            return None
+        self.nodes += 1
+        self.seen.add(key)
+        children = {}
+        useful = 0
+        for dx, dy in self.shots:
+            result = self.shoot(x, y, dx, dy, targets, remaining)
+            if result is not None and result[0] is not None:
+                useful += 1
+                children.setdefault(result[0], ((dx, dy),) + result[1:])
+        for k, (shot, nextX, nextY) in sorted(children.items()):
+            rest = self.search(nextX, nextY, targets,
+                               tuple(i for i in remaining if i != k))
+            if rest is not None:
+                return [(shot, useful / len(self.shots))] + rest
+        return None
+
+def verifySeed(job):
+    #(grade, seed, whether the level is solvable and hard enough for the
+    #grade), runs in the pool's processes
+    grade, seed, width, height, friction, r = job
+    solver = LevelSolver(width, height, friction, r)
+    solution = solver.solve(generateLevel(seed, grade, height))
+    if solution is None:
+        return grade, seed, False
+    share = sum(useful for shot, useful in solution) / len(solution)
+    return grade, seed, share <= levelGrades[grade][3]
+
+def levelHeader(width, height, friction, r):
+    return { 'version' : levelVersion, 'width' : width, 'height' : height,
+             'friction' : friction, 'r' : r, 'grades' : levelGrades }
+
+def buildLevels(perGrade=40, width=1280, height=720, friction=0.5, r=50,
+                processes=None, path=levelsPath):
+    #verifies seeds in order for every grade until perGrade of them are
+    #solvable and saves those
+    levels = {}
+    tried = 0
+    with multiprocessing.Pool(processes) as pool:
+        for grade in range(len(levelGrades)):
+            found, first = [], grade * 1000000
+            while len(found) < perGrade:
+                jobs = [(grade, seed, width, height, friction, r)
+                        for seed in range(first, first + 2 * perGrade)]
+                first += 2 * perGrade
+                tried += len(jobs)
+                for g, seed, good in pool.map(verifySeed, jobs):
+                    if good and len(found) < perGrade:
+                        found.append(seed)
+            levels[str(grade)] = found
+    data = levelHeader(width, height, friction, r)
+    data['levels'] = levels
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return tried
+
+class PracticeLevels(object):
+    #Hands out levels from the verified seeds in levels.json, at random
+    #within a grade. A grade without verified seeds for this window size
+    #gets an unverified level instead, so a level is always there at once.
+    def __init__(self, width, height, friction=0.5, r=50, path=levelsPath):
+        self.height = height
+        self.seeds = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            levels = data.pop('levels')
+            header = json.loads(json.dumps(levelHeader(width, height,
+                                                       friction, r)))
+            if data == header:
+                self.seeds = levels
+
+    def verified(self, grade):
+        return len(self.seeds.get(str(grade), [])) > 0
+
+    def next(self, grade):
+        #(seed, level) for the grade
+        if grade == brickGrade:
+            seed = random.randrange(1 << 30)
+            return seed, brickLevel(seed, self.height)
+        if self.verified(grade):
+            seed = random.choice(self.seeds[str(grade)])
+        else:
+            seed = random.randrange(1 << 30)
+        return seed, generateLevel(seed, grade, self.height)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='verify practice levels')
+    parser.add_argument('--per-grade', type=int, default=40,
+                        help='solvable levels to keep for every grade')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    tried = buildLevels(args.per_grade, processes=args.processes)
+    print(f'{tried} levels verified in {time.perf_counter() - start:.1f} s, '
+          f'solvable ones written to {levelsPath}')
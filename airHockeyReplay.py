@@ -0,0 +1,153 @@
+import os, sys, time, struct, zlib, threading, queue, argparse
+
+#Match recordings. A replay file is a header and then one fixed size record
+#per physics tick: the tick, both mallets' x, y, dx, dy as the physics saw
+#them, the seed of the tick's random numbers and a crc32 of the pucks at
+#the start of the tick. The mallets are all the input the physics gets, so
+#running the recorded mode's physics on them again gives the match back bit
+#for bit, and the crc32 shows the tick where a replay went off when the
+#physics has changed since. Records are packed into chunks in the game loop
+#and a writer thread does the disk work, so the game never waits on it.
+#"python3 airHockeyReplay.py file ..." plays replays back without a window,
+#see the bottom.
+
+replayMagic = b'AHRP'
+replayVersion = 1
+replaysDirectory = 'replays'
+#magic, version, mode, width, height, friction, pucks, puck radius
+headerFormat = struct.Struct('<4sH12sHHdHH')
+#tick, left x, y, dx, dy, right x, y, dx, dy, seed, crc32 of the pucks
+recordFormat = struct.Struct('<I8dII')
+puckFormat = struct.Struct('<4d')
+chunkRecords = 256
+
+def puckCheck(pucks):
+    #crc32 of the pucks' positions and velocities
+    check = 0
+    for puck in pucks:
+        check = zlib.crc32(puckFormat.pack(puck.x, puck.y, puck.dx, puck.dy),
+                           check)
+    return check
+
+def replayPath(directory, kind):
+    #a new file name in directory for a match of kind
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    micros = time.time_ns() // 1000 % 1000000
+    return os.path.join(directory, f'{kind}-{stamp}-{micros:06d}.replay')
+
+class ReplayWriter(object):
+    #The app's one thread for replay files: (path, data) items are appended
+    #to their files in the order they were queued, the file is opened by
+    #its first item and closed by an item without data
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            path, data = item
+            if data is None:
+                if path in self.files:
+                    self.files.pop(path).close()
+                continue
+            if path not in self.files:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.files[path] = open(path, 'wb')
+            self.files[path].write(data)
+        for f in self.files.values():
+            f.close()
+
+    def write(self, path, data):
+        self.queue.put((path, data))
+
+    def finish(self, path):
+        self.queue.put((path, None))
+
+    def close(self):
+        #writes out everything queued so far and stops the thread
+        self.queue.put(None)
+        self.thread.join()
+
+class ReplayRecorder(object):
+    #Records one match: record() packs a tick into the current chunk, which
+    #goes to the writer when it is full or when the match is over
+    def __init__(self, writer, path, kind, width, height, friction, pucks):
+        self.writer = writer
+        self.path = path
+        self.ticks = 0
+        self.filled = 0
+        self.chunk = bytearray(chunkRecords * recordFormat.size)
+        writer.write(path, headerFormat.pack(replayMagic, replayVersion,
+                                             kind.encode(), width, height,
+                                             friction, len(pucks),
+                                             pucks[0].r))
+
+    def record(self, left, right, seed, pucks):
+        recordFormat.pack_into(self.chunk, self.filled * recordFormat.size,
+                               self.ticks, left.x, left.y, left.dx, left.dy,
+                               right.x, right.y, right.dx, right.dy, seed,
+                               puckCheck(pucks))
+        self.ticks += 1
+        self.filled += 1
+        if self.filled == chunkRecords:
+            self.flush()
+
+    def flush(self):
+        if self.filled > 0:
+            self.writer.write(self.path,
+                              self.chunk[:self.filled * recordFormat.size])
+            self.filled = 0
+
+    def close(self):
+        self.flush()
+        self.writer.finish(self.path)
+
+def readReplay(path):
+    #(header, records), a record is a tuple in the order of recordFormat. A
+    #file cut off in the middle of a record keeps its whole records.
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < headerFormat.size:
+        raise ValueError(f'{path} is not a replay')
+    (magic, version, kind, width, height, friction, pucks,
+     r) = headerFormat.unpack_from(data)
+    if magic != replayMagic or version != replayVersion:
+        raise ValueError(f'{path} is not a version {replayVersion} replay')
+    header = { 'kind' : kind.rstrip(b'\0').decode(), 'width' : width,
+               'height' : height, 'friction' : friction, 'pucks' : pucks,
+               'r' : r }
+    body = memoryview(data)[headerFormat.size:]
+    body = body[:len(body) - len(body) % recordFormat.size]
+    return header, list(recordFormat.iter_unpack(body))
+
+if __name__ == '__main__':
+    from opencvAirHockey import MatchReplay
+    parser = argparse.ArgumentParser(description='play replays back without '
+                                     'a window and list their goals')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+    off = 0
+    for path in args.paths:
+        replay = MatchReplay(path)
+        start = time.perf_counter()
+        while replay.step():
+            pass
+        elapsed = time.perf_counter() - start
+        print(f'{path}: {replay.kind}, {replay.tick} ticks, '
+              f'{replay.leftScore} - {replay.rightScore}, '
+              f'replayed in {elapsed:.2f} s')
+        for tick, leftScore, rightScore in replay.goals:
+            print(f'  goal at tick {tick:6}   {leftScore} - {rightScore}')
+        if replay.diverged is None:
+            print('  bit for bit')
+        else:
+            off += 1
+            print(f'  went off at tick {replay.diverged}')
+    sys.exit(1 if off else 0)
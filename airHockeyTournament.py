@@ -0,0 +1,205 @@
+import math, time, random, argparse
+import multiprocessing
+from opencvAirHockey import Puck, makeMalletAI, physicsRate
+
+#Headless AI against AI matches on a process pool, reporting win rates,
+#Elo ratings and goal rates, run with "python3 airHockeyTournament.py",
+#see the bottom. Matches use the game's own Puck and AI mallets in one
+#player mode's tick order. Only the face-offs differ: the puck is served
+#from the middle in a direction drawn from the match's seed, since two AIs
+#that never guess would otherwise play the same match every time, and the
+#puck is served again after stallTicks without a goal, since two mallets
+#that follow the puck's y exactly can keep a flat rally going for good.
+#Those extra serves are the harness's, not the game's, so a goal from a
+#rally that started with one doesn't count toward the score, it is kept
+#apart with the stalls, and the goal rates only count the time of rallies
+#that started from a regular face-off. A minute is 60 * physicsRate ticks,
+#the rate the physics is tuned for; the game itself ticks as fast as its
+#loop gets through (a timerDelay of 5 ms, about 40 to 70 ticks a second
+#with tracking), so these minutes are not minutes of real play.
+
+width, height, friction = 1280, 720, 0.5
+ticksPerMinute = 60 * physicsRate
+stallTicks = 20 * physicsRate
+#Search decides by the clock, its matches depend on the machine's speed
+entrants = ['Mild', 'Medium', 'Nightmare', 'CMU', 'Predict', 'Table']
+
+def serve(puck, rng):
+    #puck back in the middle, moving slowly toward either side
+    puck.x, puck.y = width / 2, height / 2
+    angle = rng.uniform(-math.pi / 3, math.pi / 3)
+    speed = rng.uniform(4, 12)
+    puck.dx = rng.choice([-1, 1]) * speed * math.cos(angle)
+    puck.dy = speed * math.sin(angle)
+
+def makeEntrant(entrant, x, hand, opponent):
+    #an entrant is a difficulty, or (difficulty, ((attribute, value), ...))
+    #for an AI of that difficulty with some of its settings changed
+    difficulty, settings = ((entrant, ()) if isinstance(entrant, str)
+                            else entrant)
+    mallet = makeMalletAI(difficulty, x, height / 2, hand, width, height,
+                          friction, opponent)
+    for attribute, value in settings:
+        setattr(mallet, attribute, value)
+    return mallet
+
+def entrantName(entrant):
+    if isinstance(entrant, str):
+        return entrant
+    difficulty, settings = entrant
+    return difficulty + ' ' + ','.join(f'{attribute}={value}'
+                                       for attribute, value in settings)
+
+def playMatch(job):
+    #one match to goals, a draw when nobody got there in maxTicks, runs in
+    #the pool's processes. Returns (index, left, right, scores, ticks,
+    #stalls, reserveGoals, playedTicks): scores only has the goals of
+    #rallies from a regular face-off, reserveGoals those after a stall and
+    #playedTicks the ticks of the regular rallies.
+    index, left, right, seed, goals, maxTicks = job
+    rng = random.Random(seed)
+    puck = Puck(width / 2, height / 2, 0, 0)
+    #an AI's hand is the side its opponent plays on
+    leftMallet = makeEntrant(left, 50, 'Right', None)
+    rightMallet = makeEntrant(right, width - 50, 'Left', leftMallet)
+    if hasattr(leftMallet, 'opponent'):
+        #only the AIs that plan on the other mallet keep one
+        leftMallet.opponent = rightMallet
+    scores, reserveGoals = [0, 0], [0, 0]
+    ticks = stalls = lastServe = playedTicks = 0
+    reserved = False #whether this rally started with a stall's serve
+    serve(puck, rng)
+    while max(scores) < goals and ticks < maxTicks:
+        ticks += 1
+        if not reserved:
+            playedTicks += 1
+        if ticks - lastServe > stallTicks:
+            stalls += 1
+            if not reserved:
+                #the stalled part of the rally wasn't play either
+                playedTicks -= ticks - lastServe
+            lastServe = ticks
+            reserved = True
+            serve(puck, rng)
+        leftMallet.move(puck)
+        leftMallet.fixPosition(0, width / 2, height)
+        rightMallet.move(puck)
+        rightMallet.fixPosition(width / 2, width, height)
+        puck.puckRebound(leftMallet)
+        puck.puckRebound(rightMallet)
+        puck.applyFriction(friction)
+        puck.move()
+        if puck.x < 0 or puck.x > width:
+            (reserveGoals if reserved else scores)[
+                0 if puck.x > width else 1] += 1
+            lastServe = ticks
+            reserved = False
+            serve(puck, rng)
+        puck.puckHitsEdge(height)
+    return (index, left, right, scores, ticks, stalls, reserveGoals,
+            playedTicks)
+
+def eloRatings(results, names, k=16, start=1500):
+    #ratings after playing through the results in schedule order, so they
+    #don't depend on which process finished first
+    ratings = dict.fromkeys(names, start)
+    for index, left, right, scores, *rest in sorted(results):
+        expected = 1 / (1 + 10 ** ((ratings[right] - ratings[left]) / 400))
+        if scores[0] == scores[1]:
+            actual = 0.5
+        else:
+            actual = 1 if scores[0] > scores[1] else 0
+        ratings[left] += k * (actual - expected)
+        ratings[right] -= k * (actual - expected)
+    return ratings
+
+def runTournament(names, rounds=10, seed=0, goals=6,
+                  maxTicks=5 * ticksPerMinute, processes=None):
+    #every name plays every other one rounds times on either side, match i
+    #is seeded with seed and i so a tournament can be replayed exactly
+    pairs = [(left, right) for left in names for right in names
+             if left != right]
+    jobs = [(index, left, right, seed * 1000003 + index, goals, maxTicks)
+            for index, (left, right) in enumerate(pairs * rounds)]
+    processes = processes or multiprocessing.cpu_count()
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        results = list(pool.imap_unordered(playMatch, jobs,
+                       chunksize=max(1, len(jobs) // (8 * processes))))
+    return results, time.perf_counter() - start
+
+def summarize(results, names, elapsed):
+    #per name record and rates, and the throughput of the whole tournament
+    stats = { name : { 'played' : 0, 'wins' : 0, 'draws' : 0, 'losses' : 0,
+                       'goalsFor' : 0, 'goalsAgainst' : 0, 'ticks' : 0,
+                       'playedTicks' : 0, 'stalls' : 0, 'reserveGoals' : 0 }
+              for name in names }
+    for (index, left, right, scores, ticks, stalls, reserveGoals,
+         playedTicks) in results:
+        for name, mine, theirs, extra in [(left, scores[0], scores[1],
+                                           reserveGoals[0]),
+                                          (right, scores[1], scores[0],
+                                           reserveGoals[1])]:
+            entry = stats[name]
+            entry['played'] += 1
+            entry['ticks'] += ticks
+            entry['playedTicks'] += playedTicks
+            entry['stalls'] += stalls
+            entry['reserveGoals'] += extra
+            entry['goalsFor'] += mine
+            entry['goalsAgainst'] += theirs
+            if mine > theirs:
+                entry['wins'] += 1
+            elif mine < theirs:
+                entry['losses'] += 1
+            else:
+                entry['draws'] += 1
+    ratings = eloRatings(results, names)
+    for name, entry in stats.items():
+        minutes = entry['playedTicks'] / ticksPerMinute or 1
+        entry['winRate'] = entry['wins'] / (entry['played'] or 1)
+        entry['elo'] = ratings[name]
+        entry['goalsPerMinute'] = entry['goalsFor'] / minutes
+        entry['againstPerMinute'] = entry['goalsAgainst'] / minutes
+    ticks = sum(result[4] for result in results)
+    return { 'matches' : len(results),
+             'stalls' : sum(result[5] for result in results),
+             'reserveGoals' : sum(sum(result[6]) for result in results),
+             'seconds' : elapsed,
+             'ticks' : ticks,
+             'ticksPerSecond' : ticks / elapsed,
+             'matchesPerSecond' : len(results) / elapsed,
+             'players' : stats }
+
+def printSummary(summary):
+    players = sorted(summary['players'].items(),
+                     key=lambda item: -item[1]['elo'])
+    print(f"{'':10} {'elo':>6} {'win%':>6} {'W':>5} {'D':>5} {'L':>5} "
+          f"{'for/min':>8} {'against/min':>12} {'stalls':>7} "
+          f"{'after stall':>12}")
+    for name, entry in players:
+        print(f"{entrantName(name):10} {entry['elo']:6.0f} {100 * entry['winRate']:6.1f} "
+              f"{entry['wins']:5} {entry['draws']:5} {entry['losses']:5} "
+              f"{entry['goalsPerMinute']:8.2f} "
+              f"{entry['againstPerMinute']:12.2f} {entry['stalls']:7} "
+              f"{entry['reserveGoals']:12}")
+    print(f"{summary['matches']} matches in {summary['seconds']:.1f} s, "
+          f"{summary['matchesPerSecond']:.1f} matches/s, "
+          f"{summary['ticksPerSecond']:.0f} simulated ticks/s, "
+          f"{summary['stalls']} stalled rallies served again, "
+          f"{summary['reserveGoals']} goals after those not counted")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AI against AI tournament')
+    parser.add_argument('names', nargs='*', default=entrants,
+                        help='difficulties to enter')
+    parser.add_argument('--rounds', type=int, default=10,
+                        help='matches per pair and side')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--goals', type=int, default=6,
+                        help='goals that win a match')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    results, elapsed = runTournament(args.names, args.rounds, args.seed,
+                                     args.goals, processes=args.processes)
+    printSummary(summarize(results, args.names, elapsed))
@@ -0,0 +1,1493 @@
+import math, time, json, os, threading
+from collections import deque
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2 as cv
+
+#Vision helpers for opencvAirHockey.py, the opencv methods used here are
+#referenced from the official opencv-python documentation, link:
+#https://docs.opencv.org/master/d6/d00/tutorial_py_root.html
+
+def findFeatures(gray, bbox, maxCorners=20):
+    #find a few good corners in the inner half of an opencv rectangle for
+    #optical flow, the border of a box is mostly background
+    x, y, w, h = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
+    x, y, w, h = x + w // 4, y + h // 4, w // 2, h // 2
+    mask = np.zeros(gray.shape, np.uint8)
+    mask[max(y, 0):max(y + h, 0), max(x, 0):max(x + w, 0)] = 255
+    return cv.goodFeaturesToTrack(gray, maxCorners, 0.01, 3, mask=mask)
+
+def boxDrift(bbox1, bbox2):
+    #distance between the middles of two opencv rectangles
+    return math.hypot(bbox1[0] + bbox1[2] / 2 - bbox2[0] - bbox2[2] / 2,
+                      bbox1[1] + bbox1[3] / 2 - bbox2[1] - bbox2[3] / 2)
+
+def scaleBox(bbox, oldSize, newSize):
+    #an opencv rectangle on a frame of oldSize moved to a frame of newSize
+    if bbox is None:
+        return None
+    scaleX, scaleY = newSize[0] / oldSize[0], newSize[1] / oldSize[1]
+    return (int(round(bbox[0] * scaleX)), int(round(bbox[1] * scaleY)),
+            int(round(bbox[2] * scaleX)), int(round(bbox[3] * scaleY)))
+
+def emptyBox(bbox):
+    #True for no box at all and for the (0, 0, 0, 0) a lost track hands back
+    return bbox is None or bbox[2] <= 0 or bbox[3] <= 0
+
+def movingAverage(average, value, weight=0.1):
+    if average is None:
+        return value
+    return average + weight * (value - average)
+
+class FlowTracker(object):
+    #Runs the full opencv tracker (CSRT by default) only every stride frames
+    #and moves the box with pyramidal Lucas-Kanade optical flow on a few
+    #feature points in between. It has the same init/update interface as
+    #the opencv trackers so it can replace cv.TrackerCSRT_create() directly.
+    #A full update does nothing but the tracker unless flow frames follow
+    #it, so at stride 1 it costs what the tracker alone does. The stride is
+    #tuned from the measured cost of both kinds of frame and from the drift
+    #between where flow would have put the box and the tracker's box.
+    needsSelection = True
+
+    def __init__(self, createTracker=None, maxStride=6, driftTolerance=6,
+                 targetCost=0.004, minPoints=4):
+        self.createTracker = createTracker or cv.TrackerCSRT_create
+        self.maxStride = maxStride
+        self.driftTolerance = driftTolerance #in pixels of the tracked frame
+        self.targetCost = targetCost #seconds per frame we aim to spend
+        self.minPoints = minPoints
+        self.tracker = None
+        self.bbox = None
+        self.prevGray = None
+        self.points = None
+        self.shift = None #how far flow moved the box on the last frame
+        self.stride = 1
+        self.strideCap = maxStride #lowered whenever flow drifts too much
+        self.framesSinceFull = 0
+        self.fullCost = None #moving averages in seconds per frame
+        self.flowCost = None
+        self.drift = 0
+
+    def init(self, frame, bbox):
+        self.tracker = self.createTracker()
+        self.tracker.init(frame, bbox)
+        self.bbox = tuple(bbox)
+        self.prevGray = None
+        self.points = None
+        self.shift = None
+        self.stride = 1
+        self.framesSinceFull = 0
+        return True
+
+    def retune(self, frame, bbox, createTracker, maxStride):
+        #start again on a frame of another size or with another tracker
+        self.createTracker = createTracker
+        self.maxStride = maxStride
+        self.strideCap = maxStride
+        self.fullCost = None
+        return self.init(frame, bbox)
+
+    def flow(self, gray):
+        #propagate the feature points and return the shifted box, or None
+        #if too few points survived
+        if self.points is None or len(self.points) < self.minPoints:
+            return None
+        newPoints, status, err = cv.calcOpticalFlowPyrLK(self.prevGray, gray,
+                                    self.points, None, winSize=(15, 15),
+                                    maxLevel=2)
+        good = status.ravel() == 1
+        if good.sum() < self.minPoints:
+            return None
+        shift = np.median(newPoints[good] - self.points[good], axis=0).ravel()
+        self.points = newPoints[good].reshape(-1, 1, 2)
+        x, y, w, h = self.bbox
+        return (x + float(shift[0]), y + float(shift[1]), w, h)
+
+    def update(self, frame):
+        self.framesSinceFull += 1
+        if self.framesSinceFull < self.stride:
+            start = time.perf_counter()
+            gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+            flowBox = self.flow(gray)
+            if flowBox is not None:
+                self.shift = (flowBox[0] - self.bbox[0],
+                              flowBox[1] - self.bbox[1])
+                self.bbox = flowBox
+                self.prevGray = gray
+                self.flowCost = movingAverage(self.flowCost,
+                                              time.perf_counter() - start)
+                return True, self.bbox
+            #too few points left to follow, do the full update now
+        return self.fullUpdate(frame)
+
+    def predicted(self):
+        #where flow would have put the box on this frame, going on as it
+        #did on the last one; None when the last frame wasn't a flow frame
+        if self.shift is None:
+            return None
+        x, y, w, h = self.bbox
+        return (x + self.shift[0], y + self.shift[1], w, h)
+
+    def fullUpdate(self, frame):
+        start = time.perf_counter()
+        predicted = self.predicted()
+        self.shift = None
+        self.framesSinceFull = 0
+        ret, bbox = self.tracker.update(frame)
+        if not ret and predicted is not None:
+            #the tracker lost the object while flow moved it further than
+            #the tracker searches, so start the tracker again where flow is
+            self.strideCap = max(1, self.strideCap - 1)
+            self.stride = min(self.stride, self.strideCap)
+            self.tracker = self.createTracker()
+            self.tracker.init(frame, tuple(int(v) for v in predicted))
+            ret, bbox = True, predicted
+        if not ret:
+            return False, bbox
+        self.bbox = tuple(bbox)
+        if predicted is not None:
+            self.drift = boxDrift(predicted, self.bbox)
+        self.tuneStride()
+        if self.stride > 1:
+            #flow frames follow, they start from this frame's features
+            self.prevGray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+            self.points = findFeatures(self.prevGray, self.bbox)
+        self.fullCost = movingAverage(self.fullCost,
+                                      time.perf_counter() - start)
+        return True, self.bbox
+
+    def tuneStride(self):
+        #the cap on the stride is walked down when flow drifts from the
+        #tracker and back up when they agree, then the stride is the
+        #smallest one whose average cost per frame, (stride - 1) flow
+        #frames and a full one, fits the target. Before any flow frame
+        #was timed flow counts as free, so the stride goes up as soon as
+        #the tracker alone is over the target and flow gets measured.
+        if self.drift > self.driftTolerance:
+            self.strideCap = max(1, self.strideCap - 1)
+        elif self.drift < self.driftTolerance / 2:
+            self.strideCap = min(self.maxStride, self.strideCap + 1)
+        if self.fullCost is None:
+            return
+        flowCost = self.flowCost or 0
+        if self.targetCost <= flowCost:
+            needed = self.strideCap
+        else:
+            needed = math.ceil((self.fullCost - flowCost) /
+                               (self.targetCost - flowCost))
+        self.stride = max(1, min(self.strideCap, needed))
+
+#one pool shared by every ParallelTrackers, opencv releases the GIL inside
+#the tracker updates so threads are enough to run them side by side
+trackerPool = None
+
+def getTrackerPool():
+    global trackerPool
+    if trackerPool is None:
+        trackerPool = ThreadPoolExecutor(max_workers=4,
+                                         thread_name_prefix='tracker')
+    return trackerPool
+
+class ParallelTrackers(object):
+    #Drop-in replacement for cv.MultiTracker that updates every tracker at
+    #the same time on the tracker pool instead of one after the other, so
+    #two players cost about as much as one. Every tracker gets the same
+    #frame object for a given update, and update() waits for all of them
+    #before it returns, so no tracker can run ahead onto the next frame.
+    def __init__(self):
+        self.trackers = []
+
+    @property
+    def needsSelection(self):
+        return (len(self.trackers) == 0 or
+                any(tracker.needsSelection for tracker in self.trackers))
+
+    def add(self, tracker, frame, bbox):
+        tracker.init(frame, bbox)
+        self.trackers.append(tracker)
+        return True
+
+    def retune(self, frame, boxes, createTracker, maxStride):
+        for tracker, bbox in zip(self.trackers, boxes):
+            tracker.retune(frame, bbox, createTracker, maxStride)
+        return True
+
+    def update(self, frame):
+        pool = getTrackerPool()
+        futures = [pool.submit(tracker.update, frame)
+                   for tracker in self.trackers]
+        results = [future.result() for future in futures]
+        ret = len(results) > 0 and all(result[0] for result in results)
+        return ret, [result[1] for result in results]
+
+#aruco moved to an ArucoDetector object in newer opencv-contrib builds, the
+#helpers below work with both the old functions and the new classes
+def getArucoDictionary(name=cv.aruco.DICT_4X4_50):
+    return cv.aruco.getPredefinedDictionary(name)
+
+def drawArucoMarker(dictionary, markerId, size):
+    if hasattr(cv.aruco, 'generateImageMarker'):
+        return cv.aruco.generateImageMarker(dictionary, markerId, size)
+    return cv.aruco.drawMarker(dictionary, markerId, size)
+
+class ArucoTracker(object):
+    #Tracks one printed aruco marker by detecting it on every frame, so
+    #there is no selection step and a lost marker is found again as soon
+    #as it shows up. Detection only looks at the area around the last pose
+    #and falls back to the whole frame when the marker isn't there.
+    #update() returns (ret, bbox) just like the opencv trackers.
+    needsSelection = False
+    takesArea = True
+
+    def __init__(self, markerId, margin=1.0, dictionary=None):
+        self.markerId = markerId
+        self.margin = margin #search area padding, in marker sizes
+        self.dictionary = dictionary or getArucoDictionary()
+        self.newApi = hasattr(cv.aruco, 'ArucoDetector')
+        if self.newApi:
+            self.parameters = cv.aruco.DetectorParameters()
+            self.areaParameters = cv.aruco.DetectorParameters()
+            self.detector = cv.aruco.ArucoDetector(self.dictionary,
+                                                   self.parameters)
+            self.areaDetector = cv.aruco.ArucoDetector(self.dictionary,
+                                                   self.areaParameters)
+        else:
+            self.parameters = cv.aruco.DetectorParameters_create()
+            self.areaParameters = cv.aruco.DetectorParameters_create()
+        self.bbox = None
+
+    def init(self, frame, bbox=None):
+        self.bbox = bbox
+        return True
+
+    def retune(self, frame, bbox, createTracker, maxStride):
+        #detection works at any frame size, only the last pose moves
+        return self.init(frame, bbox)
+
+    def detect(self, gray, offsetX=0, offsetY=0, inArea=False):
+        #bounding box of our marker in gray, in full frame coordinates
+        if inArea:
+            #the perimeter limit is relative to the image size, so in a small
+            #search area every bit of noise would become a candidate unless
+            #the limit is set from the size we last saw the marker at
+            x, y, w, h = self.bbox
+            self.areaParameters.minMarkerPerimeterRate = min(1.0,
+                                    (w + h) / max(gray.shape))
+            parameters = self.areaParameters
+        else:
+            parameters = self.parameters
+        if self.newApi:
+            detector = self.areaDetector if inArea else self.detector
+            detector.setDetectorParameters(parameters)
+            corners, ids, rejected = detector.detectMarkers(gray)
+        else:
+            corners, ids, rejected = cv.aruco.detectMarkers(gray,
+                                    self.dictionary, parameters=parameters)
+        if ids is None:
+            return None
+        ids = ids.ravel()
+        for i in range(len(ids)):
+            if ids[i] == self.markerId:
+                x, y, w, h = cv.boundingRect(corners[i].astype(np.float32))
+                return (x + offsetX, y + offsetY, w, h)
+        return None
+
+    def searchArea(self, height, width):
+        x, y, w, h = self.bbox
+        padX, padY = w * self.margin, h * self.margin
+        x0, y0 = max(int(x - padX), 0), max(int(y - padY), 0)
+        x1 = min(int(x + w + padX), width)
+        y1 = min(int(y + h + padY), height)
+        return x0, y0, x1, y1
+
+    def update(self, frame, area=None):
+        #area (x0, y0, x1, y1) narrows the fallback search to where a
+        #MotionGate saw something move
+        gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+        bbox = None
+        if self.bbox is not None:
+            x0, y0, x1, y1 = self.searchArea(*gray.shape)
+            if x1 > x0 and y1 > y0:
+                bbox = self.detect(gray[y0:y1, x0:x1], x0, y0, True)
+        if bbox is None and area is not None:
+            x0, y0, x1, y1 = area
+            if x1 > x0 and y1 > y0:
+                bbox = self.detect(gray[y0:y1, x0:x1], x0, y0)
+        elif bbox is None:
+            bbox = self.detect(gray)
+        if bbox is None:
+            self.bbox = None
+            return False, (0, 0, 0, 0)
+        self.bbox = bbox
+        return True, bbox
+
+class MotionGate(object):
+    #Cheap pre-stage in front of a tracker. Every frame is shrunk to a
+    #small gray image and compared with the one the tracker last ran on,
+    #and the tracker only runs when enough pixels changed around the last
+    #box. A still object (the AI's turn, the pause after a goal) then costs
+    #a resize and a difference instead of a tracker update. While the
+    #object is lost the whole frame is watched, and trackers that take an
+    #area only search the bounding box of what moved. Same interface as
+    #the tracker it wraps.
+    def __init__(self, tracker, scale=0.125, threshold=25, minPixels=2,
+                 margin=0.5):
+        self.tracker = tracker
+        self.scale = scale
+        self.threshold = threshold #gray level change that counts as motion
+        self.minPixels = minPixels #changed pixels of the shrunk frame
+        self.margin = margin #watched area padding, in box sizes
+        self.bbox = None
+        self.reference = None
+        self.skipped = 0
+        self.updates = 0
+
+    @property
+    def needsSelection(self):
+        return self.tracker.needsSelection
+
+    def init(self, frame, bbox):
+        self.bbox = None if bbox is None else tuple(bbox)
+        self.reference = None
+        return self.tracker.init(frame, bbox)
+
+    def retune(self, frame, bbox, createTracker, maxStride):
+        self.bbox = None if bbox is None else tuple(bbox)
+        self.reference = None
+        return self.tracker.retune(frame, bbox, createTracker, maxStride)
+
+    def shrink(self, frame):
+        small = cv.resize(frame, None, fx=self.scale, fy=self.scale,
+                          interpolation=cv.INTER_AREA)
+        return cv.cvtColor(small, cv.COLOR_BGR2GRAY)
+
+    def motionArea(self, small):
+        #(x0, y0, x1, y1) in frame pixels around what moved since the
+        #reference, or None if nothing did
+        height, width = small.shape
+        x0, y0, x1, y1 = 0, 0, width, height
+        if self.bbox is not None:
+            x, y, w, h = [v * self.scale for v in self.bbox]
+            padX, padY = w * self.margin + 1, h * self.margin + 1
+            x0, y0 = max(int(x - padX), 0), max(int(y - padY), 0)
+            x1 = min(int(math.ceil(x + w + padX)), width)
+            y1 = min(int(math.ceil(y + h + padY)), height)
+            if x1 <= x0 or y1 <= y0:
+                #the box is off the frame, let the tracker sort it out
+                return 0, 0, int(width / self.scale), int(height / self.scale)
+        diff = cv.absdiff(small[y0:y1, x0:x1], self.reference[y0:y1, x0:x1])
+        _, moved = cv.threshold(diff, self.threshold, 255, cv.THRESH_BINARY)
+        if cv.countNonZero(moved) < self.minPixels:
+            return None
+        x, y, w, h = cv.boundingRect(moved)
+        #one shrunk pixel of slack on every side
+        return (max(int((x0 + x - 1) / self.scale), 0),
+                max(int((y0 + y - 1) / self.scale), 0),
+                int(math.ceil((x0 + x + w + 1) / self.scale)),
+                int(math.ceil((y0 + y + h + 1) / self.scale)))
+
+    def update(self, frame):
+        small = self.shrink(frame)
+        area = None
+        if self.reference is not None and self.reference.shape == small.shape:
+            area = self.motionArea(small)
+            if area is None:
+                self.skipped += 1
+                if self.bbox is None:
+                    return False, (0, 0, 0, 0)
+                return True, self.bbox
+        if getattr(self.tracker, 'takesArea', False):
+            ret, bbox = self.tracker.update(frame, area)
+        else:
+            ret, bbox = self.tracker.update(frame)
+        self.updates += 1
+        self.reference = small
+        self.bbox = tuple(bbox) if ret else None
+        return ret, bbox
+
+#hue ranges of the arcade paddle colors in opencv units (0-179), a range
+#with low > high wraps around, which is what red needs
+paddleHues = { 'red' : (170, 10),
+               'yellow' : (20, 35),
+               'green' : (45, 80),
+               'blue' : (100, 130) }
+
+class ColorTracker(object):
+    #Finds every player's colored paddle in one pass: the frame is shrunk,
+    #converted to HSV once, and lookup tables turn the hue of each pixel
+    #into a bit mask with one bit per player whose color it is, cleared
+    #where saturation or value are too low. The centroid of every player
+    #then comes from the moments of its bit plane. update() returns
+    #(ret, boxes) like ParallelTrackers, each box is centered on the
+    #centroid so getMiddle gives it back.
+    needsSelection = False
+
+    def __init__(self, colors, scale=0.25, minSaturation=100, minValue=60,
+                 minArea=6):
+        #at most 8 colors, one bit of the mask each
+        self.colors = colors
+        self.scale = scale
+        self.minArea = minArea #in pixels of the shrunk frame
+        self.hueLut = np.zeros(256, np.uint8)
+        for bit, color in enumerate(colors):
+            low, high = paddleHues.get(color, color)
+            if low <= high:
+                self.hueLut[low:high + 1] |= 1 << bit
+            else:
+                self.hueLut[low:180] |= 1 << bit
+                self.hueLut[0:high + 1] |= 1 << bit
+        self.saturationLut = np.zeros(256, np.uint8)
+        self.saturationLut[minSaturation:] = 255
+        self.valueLut = np.zeros(256, np.uint8)
+        self.valueLut[minValue:] = 255
+
+    def init(self, frame, bbox=None):
+        return True
+
+    def retune(self, frame, boxes, createTracker, maxStride):
+        return True
+
+    def update(self, frame):
+        height, width = frame.shape[:2]
+        small = cv.resize(frame, (int(width * self.scale),
+                                  int(height * self.scale)),
+                          interpolation=cv.INTER_LINEAR)
+        hue, saturation, value = cv.split(cv.cvtColor(small,
+                                                      cv.COLOR_BGR2HSV))
+        bits = cv.bitwise_and(cv.LUT(hue, self.hueLut),
+                              cv.bitwise_and(cv.LUT(saturation,
+                                                    self.saturationLut),
+                                             cv.LUT(value, self.valueLut)))
+        ret, boxes = True, []
+        for bit in range(len(self.colors)):
+            moments = cv.moments(np.bitwise_and(bits, 1 << bit), True)
+            area = moments['m00']
+            if area < self.minArea:
+                ret = False
+                boxes.append((0, 0, 0, 0))
+                continue
+            cx = (moments['m10'] / area + 0.5) / self.scale
+            cy = (moments['m01'] / area + 0.5) / self.scale
+            size = area ** 0.5 / self.scale
+            boxes.append((cx - size / 2, cy - size / 2, size, size))
+        return ret, boxes
+
+class SingleColorTracker(ColorTracker):
+    #one paddle color, update() returns (ret, bbox) like the opencv trackers
+    def __init__(self, color, **kwargs):
+        super().__init__([color], **kwargs)
+
+    def update(self, frame):
+        ret, boxes = super().update(frame)
+        return ret, boxes[0]
+
+calibrationPath = 'calibration.json'
+
+class TableCalibration(object):
+    #Homography from the four table corners, picked on a mirrored camera
+    #frame of the given size, to a rectified view of the table of the same
+    #size. mapPoint() applies it to a single point with the matrix entries
+    #cached as floats, and rectify() warps a raw camera frame straight to
+    #the table view with remap tables that are computed once per camera and
+    #output size, so resize, flip and rectification are one pass over the
+    #table pixels.
+    def __init__(self, corners, size=(640, 360)):
+        self.corners = [(float(x), float(y)) for (x, y) in corners]
+        self.size = size
+        w, h = size
+        table = np.float32([(0, 0), (w - 1, 0), (w - 1, h - 1), (0, h - 1)])
+        self.matrix = cv.getPerspectiveTransform(np.float32(self.corners),
+                                                 table)
+        (self.h00, self.h01, self.h02, self.h10, self.h11, self.h12,
+         self.h20, self.h21, self.h22) = [float(v) for v in
+                                          self.matrix.ravel()]
+        self.maps = None
+        self.mapsKey = None
+
+    def mapPoint(self, x, y):
+        #mirrored frame coordinates to table coordinates
+        d = self.h20 * x + self.h21 * y + self.h22
+        return ((self.h00 * x + self.h01 * y + self.h02) / d,
+                (self.h10 * x + self.h11 * y + self.h12) / d)
+
+    def buildMaps(self, shape, size):
+        #for every pixel of a size table view, where it comes from in a raw
+        #camera frame of this shape
+        rawH, rawW = shape[:2]
+        w, h = self.size
+        outW, outH = size
+        ys, xs = np.indices((outH, outW), dtype=np.float32)
+        grid = np.dstack([xs * w / outW, ys * h / outH]).reshape(-1, 1, 2)
+        mirrored = cv.perspectiveTransform(grid,
+                            np.linalg.inv(self.matrix)).reshape(outH, outW, 2)
+        mapX = (w - 1 - mirrored[..., 0]) * rawW / w
+        mapY = mirrored[..., 1] * rawH / h
+        self.maps = cv.convertMaps(mapX.astype(np.float32),
+                                   mapY.astype(np.float32), cv.CV_16SC2)
+        self.mapsKey = (shape, size)
+
+    def rectify(self, frame, size=None):
+        size = size or self.size
+        if (frame.shape, size) != self.mapsKey:
+            self.buildMaps(frame.shape, size)
+        return cv.remap(frame, self.maps[0], self.maps[1], cv.INTER_LINEAR)
+
+    def save(self, path=calibrationPath):
+        with open(path, 'w') as f:
+            json.dump({'corners' : self.corners, 'size' : self.size}, f)
+
+def loadCalibration(path=calibrationPath):
+    #the saved calibration, or None if the table was never calibrated
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    return TableCalibration(data['corners'], tuple(data['size']))
+
+def pickCorners(window, frame):
+    #let the user click the table corners in the camera window, in the
+    #order top-left, top-right, bottom-right, bottom-left, Esc cancels
+    corners = []
+    def mouse(event, x, y, flags, param):
+        if event == cv.EVENT_LBUTTONDOWN and len(corners) < 4:
+            corners.append((x, y))
+    cv.setMouseCallback(window, mouse)
+    while len(corners) < 4:
+        shown = frame.copy()
+        for (x, y) in corners:
+            cv.circle(shown, (x, y), 5, (0, 255, 0), -1)
+        cv.imshow(window, shown)
+        if cv.waitKey(20) == 27:
+            corners = None
+            break
+    cv.setMouseCallback(window, lambda *args: None)
+    return corners
+
+class FrameMapper(object):
+    #Turns raw camera frames into the frames the trackers see and maps
+    #points on those frames to window coordinates. Without a calibration
+    #that is the old resize to 640x360 and mirror; with one the trackers
+    #only get the rectified table and points land where they are on the
+    #table even with an angled camera. With rectify=False the trackers get
+    #the whole mirrored frame and only the points go through the homography.
+    def __init__(self, width, height, calibration=None, size=(640, 360),
+                 rectify=True):
+        self.width = width
+        self.height = height
+        self.calibration = calibration
+        self.rectify = rectify
+        self.resize(size)
+
+    def resize(self, size):
+        #change the size of the frames the trackers see
+        self.size = size
+        self.scaleX = self.width / size[0]
+        self.scaleY = self.height / size[1]
+
+    def mirror(self, frame):
+        return cv.flip(cv.resize(frame, self.size), +1)
+
+    def prepare(self, frame):
+        if self.calibration is not None and self.rectify:
+            return self.calibration.rectify(frame, self.size)
+        return self.mirror(frame)
+
+    def toWindow(self, x, y):
+        if self.calibration is not None and not self.rectify:
+            #the homography works in the frame size it was calibrated at
+            w, h = self.calibration.size
+            x, y = self.calibration.mapPoint(x * w / self.size[0],
+                                             y * h / self.size[1])
+            return x * self.width / w, y * self.height / h
+        return x * self.scaleX, y * self.scaleY
+
+    def rawToFrame(self, x, y, shape):
+        #a point on a raw camera frame of this shape to the tracked frame
+        rawH, rawW = shape[:2]
+        if self.calibration is not None and self.rectify:
+            w, h = self.calibration.size
+            x, y = self.calibration.mapPoint((rawW - 1 - x) * w / rawW,
+                                             y * h / rawH)
+            return x * self.size[0] / w, y * self.size[1] / h
+        return (rawW - 1 - x) * self.size[0] / rawW, y * self.size[1] / rawH
+
+    def calibrate(self, window, frame):
+        #pick the corners on a mirrored frame and keep the result on disk
+        corners = pickCorners(window, self.mirror(frame))
+        if corners is not None:
+            self.calibration = TableCalibration(corners, self.size)
+            self.calibration.save()
+
+templatePath = 'templates.npz'
+
+def colorHistogram(patch):
+    #normalized hue/saturation histogram of a BGR patch
+    hsv = cv.cvtColor(patch, cv.COLOR_BGR2HSV)
+    hist = cv.calcHist([hsv], [0, 1], None, [30, 32], [0, 180, 0, 256])
+    return cv.normalize(hist, hist).astype(np.float32)
+
+class TrackerTemplates(object):
+    #What every player selected to track last time: the patch of the
+    #tracked frame inside the box, the frame size it was cut from and its
+    #color histogram, kept on disk. find() looks for a patch on a new frame
+    #with template matching and only trusts a match whose colors agree with
+    #the histogram, so a retrack or a new game can start the tracker
+    #without selecting anything.
+    def __init__(self, path=templatePath, minScore=0.6, minSimilarity=0.5):
+        self.path = path
+        self.minScore = minScore #normalized template match
+        self.minSimilarity = minSimilarity #histogram correlation
+        self.patches = {}
+        self.sizes = {}
+        self.histograms = {}
+        if os.path.exists(path):
+            with np.load(path) as data:
+                for key in data.files:
+                    if key.startswith('patch'):
+                        player = int(key[len('patch'):])
+                        self.patches[player] = data[key]
+                        self.sizes[player] = tuple(data[f'size{player}'])
+                        self.histograms[player] = data[f'histogram{player}']
+
+    def has(self, player):
+        return player in self.patches
+
+    def remember(self, player, frame, bbox, size):
+        x, y, w, h = [int(v) for v in bbox]
+        x0, y0 = max(x, 0), max(y, 0)
+        patch = frame[y0:y + h, x0:x + w]
+        if patch.shape[0] < 4 or patch.shape[1] < 4:
+            return False
+        self.patches[player] = patch.copy()
+        self.sizes[player] = tuple(size)
+        self.histograms[player] = colorHistogram(patch)
+        self.save()
+        return True
+
+    def find(self, player, frame, size):
+        #box of the player's patch on a tracked frame of this size, or None
+        if player not in self.patches:
+            return None
+        patch = self.patches[player]
+        savedW, savedH = self.sizes[player]
+        if (savedW, savedH) != tuple(size):
+            patch = cv.resize(patch, None, fx=size[0] / savedW,
+                              fy=size[1] / savedH)
+        h, w = patch.shape[:2]
+        if h < 4 or w < 4 or h > frame.shape[0] or w > frame.shape[1]:
+            return None
+        scores = cv.matchTemplate(frame, patch, cv.TM_CCOEFF_NORMED)
+        _, score, _, (x, y) = cv.minMaxLoc(scores)
+        if score < self.minScore:
+            return None
+        similarity = cv.compareHist(self.histograms[player],
+                                    colorHistogram(frame[y:y + h, x:x + w]),
+                                    cv.HISTCMP_CORREL)
+        if similarity < self.minSimilarity:
+            return None
+        return (x, y, w, h)
+
+    def save(self):
+        data = {}
+        for player in self.patches:
+            data[f'patch{player}'] = self.patches[player]
+            data[f'size{player}'] = np.array(self.sizes[player])
+            data[f'histogram{player}'] = self.histograms[player]
+        np.savez(self.path, **data)
+
+class FrameSource(object):
+    #Where the modes get their frames from. read() returns (ret, frame)
+    #like cv.VideoCapture, timestamp is the perf_counter time the boxes and
+    #frame of the last read are for, and captureTime the time the oldest
+    #camera frame behind them was captured at; they are the same unless a
+    #source predicts. With realTime the source hands out frames no faster
+    #than fps, otherwise as fast as they are asked for.
+    def __init__(self, fps=30, realTime=True):
+        self.fps = fps
+        self.realTime = realTime
+        self.frameCount = 0
+        self.startTime = None
+        self.timestamp = None
+
+    def pace(self):
+        #wait for the next frame time when running in real time
+        now = time.perf_counter()
+        if self.startTime is None:
+            self.startTime = now
+        elif self.realTime:
+            wait = self.startTime + self.frameCount / self.fps - now
+            if wait > 0:
+                time.sleep(wait)
+
+    @property
+    def captureTime(self):
+        return self.timestamp
+
+    def read(self):
+        self.pace()
+        ret, frame = self.grab()
+        self.timestamp = time.perf_counter()
+        self.frameCount += 1
+        return ret, frame
+
+    def grab(self):
+        raise NotImplementedError
+
+    remote = False #True when another process does the tracking
+
+    def truthBoxes(self, mapper):
+        #where the tracked objects are on the last frame, if the source knows
+        return None
+
+    def makeMapper(self, width, height, size):
+        #how frames of this source get to the trackers and back to the window
+        return FrameMapper(width, height, loadCalibration(), size)
+
+    def release(self):
+        pass
+
+class CameraSource(FrameSource):
+    #a webcam, the camera itself sets the pace
+    def __init__(self, index=0):
+        super().__init__(realTime=False)
+        self.cap = cv.VideoCapture(index)
+
+    def grab(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+class VideoFileSource(FrameSource):
+    #a recorded video, played at its own frame rate and looped by default
+    def __init__(self, path, realTime=True, loop=True):
+        self.cap = cv.VideoCapture(path)
+        super().__init__(self.cap.get(cv.CAP_PROP_FPS) or 30, realTime)
+        self.loop = loop
+
+    def grab(self):
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        return ret, frame
+
+    def release(self):
+        self.cap.release()
+
+class ImageDirSource(FrameSource):
+    #the images of a directory in name order, looped by default
+    def __init__(self, path, fps=30, realTime=True, loop=True):
+        super().__init__(fps, realTime)
+        extensions = ('.png', '.jpg', '.jpeg', '.bmp')
+        self.paths = sorted(os.path.join(path, name)
+                            for name in os.listdir(path)
+                            if name.lower().endswith(extensions))
+        self.loop = loop
+        self.index = 0
+
+    def grab(self):
+        if self.index >= len(self.paths):
+            if not self.loop or len(self.paths) == 0:
+                return False, None
+            self.index = 0
+        frame = cv.imread(self.paths[self.index])
+        self.index += 1
+        return frame is not None, frame
+
+def wavePath(centerX, centerY, radiusX, radiusY, periodX, periodY, phase=0):
+    #scripted trajectory, position in frame fractions at time t seconds
+    def path(t):
+        return (centerX + radiusX * math.sin(2 * math.pi * t / periodX + phase),
+                centerY + radiusY * math.sin(2 * math.pi * t / periodY))
+    return path
+
+class Disc(object):
+    #a colored disc moving along path, radius is a fraction of frame height
+    def __init__(self, color, path, radius=0.06):
+        self.color = color
+        self.path = path
+        self.radius = radius
+
+def defaultDiscs():
+    #red disc for the left player and blue for the right one, the camera
+    #isn't mirrored yet so the left player is on the right of the frame
+    return [Disc((30, 30, 210), wavePath(0.75, 0.5, 0.18, 0.35, 3.1, 2.3)),
+            Disc((210, 60, 30), wavePath(0.25, 0.5, 0.18, 0.35, 2.7, 1.9, 1))]
+
+class SyntheticSource(FrameSource):
+    #Procedural camera: colored discs move along scripted trajectories on
+    #a noisy table. The scene time of frame n is n / fps whatever the pace,
+    #so a run is the same frame for frame, and truth holds the ground truth
+    #disc centers of the last frame in camera pixels.
+    def __init__(self, discs=None, size=(1280, 720), fps=30, realTime=True,
+                 noise=8, seed=112):
+        super().__init__(fps, realTime)
+        self.discs = discs or defaultDiscs()
+        self.size = size
+        width, height = size
+        rng = np.random.default_rng(seed)
+        self.table = np.clip(rng.normal(150, noise, (height, width, 3)),
+                             0, 255).astype(np.uint8)
+        self.truth = []
+        self.sceneTime = 0
+
+    def grab(self):
+        width, height = self.size
+        self.sceneTime = self.frameCount / self.fps
+        frame = self.table.copy()
+        self.truth = []
+        for disc in self.discs:
+            fx, fy = disc.path(self.sceneTime)
+            x, y, r = fx * width, fy * height, int(disc.radius * height)
+            center = (int(round(x)), int(round(y)))
+            cv.circle(frame, center, r, disc.color, -1)
+            #a white cross gives the trackers some texture to hold on to
+            cv.line(frame, (center[0] - r // 2, center[1]),
+                    (center[0] + r // 2, center[1]), (255, 255, 255), 3)
+            cv.line(frame, (center[0], center[1] - r // 2),
+                    (center[0], center[1] + r // 2), (255, 255, 255), 3)
+            self.truth.append((x, y))
+        return True, frame
+
+    def truthBoxes(self, mapper):
+        boxes = []
+        shape = (self.size[1], self.size[0])
+        for disc, (x, y) in zip(self.discs, self.truth):
+            cx, cy = mapper.rawToFrame(x, y, shape)
+            r = disc.radius * mapper.size[1]
+            boxes.append((int(cx - r), int(cy - r), int(2 * r), int(2 * r)))
+        return boxes
+
+def openFrameSource(spec='camera'):
+    #'camera[:index]', 'video:path', 'images:directory',
+    #'synthetic[:fast]', fast meaning frames aren't paced to real time,
+    #'process:kind:spec' to track any of these in a vision process or
+    #'cameras:kind:spec+spec' for one of them per player
+    kind, _, arg = spec.partition(':')
+    if kind == 'camera':
+        return CameraSource(int(arg or 0))
+    elif kind == 'video':
+        return VideoFileSource(arg)
+    elif kind == 'images':
+        return ImageDirSource(arg)
+    elif kind == 'synthetic':
+        return SyntheticSource(realTime=(arg != 'fast'))
+    elif kind == 'process':
+        trackerKind, _, sourceSpec = arg.partition(':')
+        return VisionProcess(sourceSpec or 'camera', trackerKind or 'color')
+    elif kind == 'cameras':
+        trackerKind, _, sourceSpecs = arg.partition(':')
+        return PlayerCameras(sourceSpecs.split('+'), trackerKind or 'color')
+    raise ValueError(f'unknown frame source {spec}')
+
+def previewShape(size, previewScale):
+    #shape of the preview frames in the ring, no previews at scale 0
+    if previewScale <= 0:
+        return (0, 0, 3)
+    return (int(size[1] * previewScale), int(size[0] * previewScale), 3)
+
+class VisionRing(object):
+    #Ring buffer of tracking results in shared memory. One process writes,
+    #the others read the newest slot in place through numpy views. A slot
+    #holds the capture time, one (x, y, w, h) box and found flag per player
+    #and an optional preview frame; seqStart and seqEnd get the sequence
+    #number before and after the rest is written, so a reader can tell a
+    #slot that is being overwritten from a finished one. Like any seqlock a
+    #reader checks unchanged() again once it has read a slot, the writer may
+    #have lapped the ring while it was reading.
+    def __init__(self, name=None, players=2, previewShape=(0, 0, 3), slots=8):
+        self.slotType = np.dtype([('seqStart', np.int64),
+                                  ('timestamp', np.float64),
+                                  ('boxes', np.float64, (players, 4)),
+                                  ('found', np.uint8, (players,)),
+                                  ('preview', np.uint8, previewShape),
+                                  ('seqEnd', np.int64)], align=True)
+        size = 8 + slots * self.slotType.itemsize
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.name = self.memory.name
+        self.players = players
+        self.previewShape = previewShape
+        self.slotCount = slots
+        #the header is the sequence number of the newest finished slot
+        self.header = np.ndarray((1,), np.int64, buffer=self.memory.buf)
+        self.slots = np.ndarray((slots,), self.slotType,
+                                buffer=self.memory.buf, offset=8)
+        if self.owner:
+            self.header[0] = 0
+            self.slots['seqStart'] = -1
+            self.slots['seqEnd'] = -1
+
+    def publish(self, timestamp, boxes, preview=None):
+        seq = int(self.header[0]) + 1
+        slot = self.slots[seq % self.slotCount]
+        slot['seqStart'] = seq
+        slot['timestamp'] = timestamp
+        for i in range(self.players):
+            bbox = boxes[i] if i < len(boxes) else None
+            slot['found'][i] = bbox is not None
+            if bbox is not None:
+                slot['boxes'][i] = bbox
+        if preview is not None:
+            slot['preview'][...] = preview
+        slot['seqEnd'] = seq
+        self.header[0] = seq
+        return seq
+
+    def latest(self, tries=3):
+        #(seq, slot) of the newest finished result, the slot is a view into
+        #the shared memory and stays valid until slots more are published
+        for _ in range(tries):
+            seq = int(self.header[0])
+            if seq == 0:
+                return 0, None
+            slot = self.slots[seq % self.slotCount]
+            if slot['seqStart'] == seq and slot['seqEnd'] == seq:
+                return seq, slot
+        return 0, None
+
+    def unchanged(self, seq, slot):
+        #whether the slot latest() gave for seq still holds seq, call it after
+        #reading from the slot and throw what was read away if not
+        return slot['seqStart'] == seq
+
+    def close(self):
+        #drop the views before the memory they point into
+        self.header = self.slots = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def visionTrackers(kind, source, mapper, frame):
+    #the trackers the vision process runs, players left to right
+    if kind == 'color':
+        return ColorTracker(['red', 'blue'])
+    trackers = ParallelTrackers()
+    if kind == 'aruco':
+        trackers.add(MotionGate(ArucoTracker(0)), frame, None)
+        trackers.add(MotionGate(ArucoTracker(1)), frame, None)
+        return trackers
+    #flow trackers need boxes to start from, synthetic sources know them,
+    #otherwise they are selected in the vision process's own window
+    boxes = source.truthBoxes(mapper)
+    if boxes is None:
+        boxes = [cv.selectROI('Vision', frame, False) for _ in range(2)]
+        cv.destroyWindow('Vision')
+    for bbox in boxes[:2]:
+        trackers.add(MotionGate(FlowTracker()), frame, bbox)
+    return trackers
+
+def visionWorker(ringName, sourceSpec, kind, size, previewScale, stop):
+    #body of the vision process: capture, prepare and track as fast as the
+    #source allows and publish every result to the ring
+    ring = VisionRing(ringName, 2, previewShape(size, previewScale))
+    source = openFrameSource(sourceSpec)
+    mapper = FrameMapper(size[0], size[1], loadCalibration(), size)
+    trackers = None
+    try:
+        while not stop.is_set():
+            ret, frame = source.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            prepared = mapper.prepare(frame)
+            if trackers is None:
+                trackers = visionTrackers(kind, source, mapper, prepared)
+            ret, boxes = trackers.update(prepared)
+            if not ret and trackers.needsSelection:
+                #lost, start over from the next frame
+                trackers = None
+            preview = None
+            if previewScale > 0:
+                height, width = ring.previewShape[:2]
+                preview = cv.resize(prepared, (width, height))
+            ring.publish(source.timestamp, boxes if ret else [], preview)
+    finally:
+        source.release()
+        ring.close()
+
+class PreparedMapper(FrameMapper):
+    #Mapper for frames the vision process prepared already, they stay the
+    #size the vision process tracks at whatever the quality level says
+    def __init__(self, width, height, size):
+        self.fixedSize = size
+        super().__init__(width, height, None, size)
+
+    def resize(self, size):
+        super().resize(self.fixedSize)
+
+    def prepare(self, frame):
+        return frame
+
+class VisionProcess(FrameSource):
+    #Frame source whose capture and tracking run in a separate process, so
+    #a slow tracker frame never holds up a physics tick or a redraw. read()
+    #never waits: it returns the preview of the newest published result (a
+    #blank frame without previews) and RemoteTrackers hand out its boxes.
+    #timestamp is when the newest result's frame was captured, perf_counter
+    #is the same clock in every process.
+    remote = True
+
+    def __init__(self, sourceSpec='camera', kind='color', size=(640, 360),
+                 previewScale=0.5, slots=8):
+        super().__init__(realTime=False)
+        self.size = size
+        self.ring = VisionRing(None, 2, previewShape(size, previewScale), slots)
+        self.frame = np.zeros((size[1], size[0], 3), np.uint8)
+        self.spare = np.zeros_like(self.frame) #the next preview, until checked
+        self.seq = 0
+        self.boxes = [None, None]
+        self.found = [False, False]
+        self.stop = multiprocessing.Event()
+        self.args = (self.ring.name, sourceSpec, kind, size, previewScale,
+                     self.stop)
+        self.process = None
+
+    def read(self):
+        if self.process is None:
+            #started on the first read, every mode opens its source early
+            self.process = multiprocessing.Process(target=visionWorker,
+                                                   args=self.args, daemon=True)
+            self.process.start()
+        seq, slot = self.ring.latest()
+        if seq != self.seq and slot is not None:
+            #only the boxes are copied, a few numbers, lost players keep
+            #the box they were last found in
+            found = [bool(v) for v in slot['found']]
+            boxes = [tuple(slot['boxes'][i].tolist()) if found[i] else
+                     self.boxes[i] for i in range(self.ring.players)]
+            timestamp = float(slot['timestamp'])
+            if slot['preview'].size > 0:
+                #the camera window draws on the frame, so it can't be the
+                #shared slot itself
+                cv.resize(slot['preview'], self.size, dst=self.spare)
+            if self.ring.unchanged(seq, slot):
+                self.found, self.boxes = found, boxes
+                self.timestamp = timestamp
+                if slot['preview'].size > 0:
+                    self.frame, self.spare = self.spare, self.frame
+                self.seq = seq
+                self.frameCount += 1
+            #otherwise the writer lapped the ring while this was read, the
+            #next read gets a newer slot
+        if self.timestamp is None:
+            self.timestamp = time.perf_counter()
+        return True, self.frame
+
+    def makeMapper(self, width, height, size):
+        return PreparedMapper(width, height, self.size)
+
+    def release(self):
+        self.stop.set()
+        if self.process is not None:
+            self.process.join(2)
+            if self.process.is_alive():
+                self.process.terminate()
+        self.ring.close()
+
+class RemoteTrackers(object):
+    #Tracker interface over a source that tracks by itself (VisionProcess,
+    #PlayerCameras): update() returns what the source found for the frame
+    #read() last handed out, for every player as (ret, boxes), or for one
+    #player as (ret, bbox)
+    needsSelection = False
+
+    def __init__(self, vision, player=None):
+        self.vision = vision
+        self.player = player
+
+    def init(self, frame, bbox=None):
+        return True
+
+    def retune(self, frame, bbox, createTracker, maxStride):
+        return True
+
+    def update(self, frame):
+        if self.player is not None:
+            return (self.vision.found[self.player],
+                    self.vision.boxes[self.player])
+        return all(self.vision.found), list(self.vision.boxes)
+
+def interpolateBox(t, t0, bbox0, t1, bbox1):
+    #box at time t on the straight line between two timed boxes
+    if t1 == t0:
+        return bbox1
+    k = (t - t0) / (t1 - t0)
+    return tuple(v0 + k * (v1 - v0) for v0, v1 in zip(bbox0, bbox1))
+
+class CameraThread(object):
+    #One player's camera: captures, prepares and tracks that player on its
+    #own thread, opencv lets go of the GIL meanwhile. The last few
+    #(timestamp, found, bbox) measurements are kept so the player can be
+    #placed at any recent time, past the newest one too: there the box goes
+    #on along the least squares line through the last window seconds, for
+    #at most maxLead seconds. Flow trackers start from the truth
+    #boxes of synthetic sources, otherwise the item is selected on the main
+    #thread with select(), opencv windows don't work from other threads.
+    def __init__(self, source, kind, player, size=(640, 360), keep=8,
+                 window=0.1, maxLead=0.1):
+        self.source = source
+        self.kind = kind
+        self.player = player
+        self.window = window
+        self.maxLead = maxLead
+        self.mapper = FrameMapper(size[0], size[1], None, size)
+        self.tracker = None
+        self.frame = None #newest prepared frame
+        self.history = deque(maxlen=keep)
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def makeTracker(self, frame):
+        if self.kind == 'color':
+            return SingleColorTracker(['red', 'blue'][self.player])
+        elif self.kind == 'aruco':
+            return MotionGate(ArucoTracker(self.player))
+        boxes = self.source.truthBoxes(self.mapper)
+        if boxes is None:
+            return None
+        tracker = MotionGate(FlowTracker())
+        tracker.init(frame, boxes[self.player])
+        return tracker
+
+    def run(self):
+        while not self.stop.is_set():
+            ret, frame = self.source.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            prepared = self.mapper.prepare(frame)
+            with self.lock:
+                if self.tracker is None:
+                    self.tracker = self.makeTracker(prepared)
+                tracker = self.tracker
+            found, bbox = False, None
+            if tracker is not None:
+                found, bbox = tracker.update(prepared)
+            with self.lock:
+                if not found and tracker is not None and tracker.needsSelection:
+                    #lost, pick it up again
+                    if self.tracker is tracker:
+                        self.tracker = None
+                self.frame = prepared
+                self.history.append((self.source.timestamp, found, bbox))
+
+    def needsSelection(self):
+        return (self.kind == 'flow' and self.tracker is None and
+                self.frame is not None)
+
+    def select(self, window):
+        with self.lock:
+            frame = self.frame.copy()
+        bbox = cv.selectROI(window, frame, False)
+        tracker = MotionGate(FlowTracker())
+        tracker.init(frame, bbox)
+        with self.lock:
+            self.tracker = tracker
+
+    def newest(self):
+        #capture time of the newest measurement
+        with self.lock:
+            return self.history[-1][0] if self.history else None
+
+    def at(self, t):
+        #(found, bbox) at time t, between the measurements around it or
+        #ahead of the newest one
+        with self.lock:
+            history = list(self.history)
+        if not history or not history[-1][1]:
+            return False, None
+        found = [(ts, bbox) for ts, ok, bbox in history if ok]
+        if t >= found[-1][0]:
+            return True, self.extrapolate(t, found)
+        if t <= found[0][0]:
+            return True, found[0][1]
+        for (t0, bbox0), (t1, bbox1) in zip(found, found[1:]):
+            if t0 <= t <= t1:
+                return True, interpolateBox(t, t0, bbox0, t1, bbox1)
+        return True, found[-1][1]
+
+    def extrapolate(self, t, found):
+        #the newest box moved on to time t at the velocity of the recent
+        #boxes, the same fit the VelocityEstimator uses
+        tLast, bbox = found[-1]
+        recent = [(ts, box[0], box[1]) for ts, box in found
+                  if ts >= tLast - self.window]
+        if len(recent) < 2:
+            return bbox
+        vx, vy = fitSlope(recent)[:2]
+        lead = min(t - tLast, self.maxLead)
+        x, y, w, h = bbox
+        return (x + vx * lead, y + vy * lead, w, h)
+
+    def release(self):
+        self.stop.set()
+        if self.thread.is_alive():
+            self.thread.join(2)
+        self.source.release()
+
+class PlayerCameras(FrameSource):
+    #One capture device or file per player, each with its own CameraThread,
+    #so every player gets a whole frame instead of half of a shared one.
+    #Every read() places every player where their camera's measurements
+    #put them at the time of the read, the tick's time, so both mallets of
+    #a tick are for the same moment and the slower camera's lag isn't
+    #added to the other player. The frame read() returns has the
+    #prepared frames side by side, player 0 on the left, and the boxes are
+    #in that frame like the ones of a single camera. Players are tracked
+    #through RemoteTrackers.
+    remote = True
+
+    def __init__(self, specs, kind='color', size=(640, 360)):
+        super().__init__(realTime=False)
+        self.cameras = [CameraThread(openFrameSource(spec), kind, player,
+                                     size)
+                        for player, spec in enumerate(specs)]
+        self.cameraSize = size
+        self.size = (size[0] * len(specs), size[1])
+        self.frame = np.zeros((self.size[1], self.size[0], 3), np.uint8)
+        self.boxes = [None] * len(specs)
+        self.found = [False] * len(specs)
+        self.started = False
+        self.oldestCapture = None
+
+    @property
+    def captureTime(self):
+        return self.oldestCapture
+
+    def read(self):
+        if not self.started:
+            for camera in self.cameras:
+                camera.thread.start()
+            self.started = True
+        for camera in self.cameras:
+            if camera.needsSelection():
+                camera.select('Tracking')
+        newest = [camera.newest() for camera in self.cameras]
+        if None in newest:
+            if self.timestamp is None:
+                self.timestamp = self.oldestCapture = time.perf_counter()
+            return True, self.frame
+        if min(newest) != self.oldestCapture:
+            self.frameCount += 1
+        self.oldestCapture = min(newest)
+        t = self.timestamp = time.perf_counter()
+        width = self.cameraSize[0]
+        for player, camera in enumerate(self.cameras):
+            found, bbox = camera.at(t)
+            self.found[player] = found
+            if found:
+                x, y, w, h = bbox
+                self.boxes[player] = (x + player * width, y, w, h)
+            if camera.frame is not None:
+                self.frame[:, player * width:(player + 1) * width] = (
+                    camera.frame)
+        return True, self.frame
+
+    def makeMapper(self, width, height, size):
+        return PreparedMapper(width, height, self.size)
+
+    def release(self):
+        for camera in self.cameras:
+            camera.release()
+
+def fitSlope(samples):
+    #least squares velocity through (t, x, y) samples, in px/second
+    n = len(samples)
+    meanT = sum(t for t, x, y in samples) / n
+    meanX = sum(x for t, x, y in samples) / n
+    meanY = sum(y for t, x, y in samples) / n
+    varT = sum((t - meanT) ** 2 for t, x, y in samples)
+    if varT == 0:
+        return 0, 0, meanT, meanX, meanY
+    vx = sum((t - meanT) * (x - meanX) for t, x, y in samples) / varT
+    vy = sum((t - meanT) * (y - meanY) for t, x, y in samples) / varT
+    return vx, vy, meanT, meanX, meanY
+
+class VelocityEstimator(object):
+    #Velocity of a tracked point from where it was seen at which capture
+    #time, so it doesn't depend on the camera rate or on tick jitter. The
+    #samples of the last window seconds get a straight line fit, samples
+    #further than outlierDistance pixels (and than 3 times the typical
+    #miss) from the line are thrown out as tracker glitches and the line is
+    #fit again. A frame seen twice is only counted once.
+    def __init__(self, window=0.1, outlierDistance=8):
+        self.window = window
+        self.outlierDistance = outlierDistance
+        self.samples = []
+        self.vx = self.vy = 0
+
+    def add(self, timestamp, x, y):
+        if self.samples and timestamp <= self.samples[-1][0]:
+            return False
+        self.samples.append((timestamp, x, y))
+        while (len(self.samples) > 2 and
+               self.samples[0][0] < timestamp - self.window):
+            self.samples.pop(0)
+        if self.samples[0][0] < timestamp - 2 * self.window:
+            #the point wasn't seen for a while, start over
+            self.samples = self.samples[-1:]
+        self.vx, self.vy = self.estimate()
+        return True
+
+    def estimate(self):
+        if len(self.samples) < 2:
+            return 0, 0
+        vx, vy, meanT, meanX, meanY = fitSlope(self.samples)
+        if len(self.samples) < 4:
+            return vx, vy
+        misses = [math.hypot(x - meanX - vx * (t - meanT),
+                             y - meanY - vy * (t - meanT))
+                  for t, x, y in self.samples]
+        typical = sorted(misses)[len(misses) // 2]
+        limit = max(self.outlierDistance, 3 * typical)
+        inliers = [sample for sample, miss in zip(self.samples, misses)
+                   if miss <= limit]
+        if 2 <= len(inliers) < len(self.samples):
+            vx, vy = fitSlope(inliers)[:2]
+        return vx, vy
+
+    def velocity(self):
+        #(vx, vy) in px/second
+        return self.vx, self.vy
+
+    def reset(self):
+        self.samples = []
+        self.vx = self.vy = 0
+
+def percentiles(values):
+    #summary in milliseconds of a list of seconds
+    if len(values) == 0:
+        return None
+    values = np.array(values) * 1000
+    return { 'mean' : float(values.mean()),
+             'p50' : float(np.percentile(values, 50)),
+             'p90' : float(np.percentile(values, 90)),
+             'p99' : float(np.percentile(values, 99)),
+             'max' : float(values.max()) }
+
+class LatencyProbe(object):
+    #Follows each camera frame from its capture to the redraw that shows
+    #the mallet it moved. start() takes the capture time from the frame
+    #source, every stage marks when it is done with the frame and the redraw
+    #finishes it, after redrawAll and not inside it. Frames that never reach
+    #the physics (while selecting) are dropped.
+    stages = ['capture', 'prepare', 'track', 'physics', 'render']
+
+    def __init__(self, history=1000):
+        self.current = None
+        self.records = []
+        self.history = history
+
+    def start(self, captureTime):
+        self.current = {'capture' : captureTime}
+
+    def mark(self, stage):
+        if self.current is not None:
+            self.current[stage] = time.perf_counter()
+
+    def finish(self):
+        if self.current is None or 'physics' not in self.current:
+            return
+        self.mark('render')
+        self.records.append(self.current)
+        if len(self.records) > self.history:
+            self.records.pop(0)
+        self.current = None
+
+    def report(self):
+        #how long every stage took after the one before it, and in total
+        report = dict()
+        for i in range(1, len(self.stages)):
+            before, stage = self.stages[i - 1], self.stages[i]
+            report[stage] = percentiles([record[stage] - record[before]
+                                         for record in self.records])
+        report['total'] = percentiles([record['render'] - record['capture']
+                                       for record in self.records])
+        return report
+
+    def formatReport(self):
+        report = self.report()
+        lines = [f'latency over the last {len(self.records)} frames (ms)']
+        for stage in self.stages[1:] + ['total']:
+            if report[stage] is not None:
+                lines.append(f"  {stage:8} p50 {report[stage]['p50']:7.2f}"
+                             f"   p90 {report[stage]['p90']:7.2f}"
+                             f"   p99 {report[stage]['p99']:7.2f}")
+        return '\n'.join(lines)
+
+def createKCF():
+    #KCF is much cheaper than CSRT, it moved to cv.legacy in some builds
+    if hasattr(cv, 'TrackerKCF_create'):
+        return cv.TrackerKCF_create()
+    return cv.legacy.TrackerKCF_create()
+
+#the quality levels from best to cheapest:
+#(size of the frames the trackers see, full tracker, max tracker stride)
+qualityLevels = [ ((640, 360), cv.TrackerCSRT_create, 1),
+                  ((640, 360), cv.TrackerCSRT_create, 3),
+                  ((480, 270), cv.TrackerCSRT_create, 6),
+                  ((480, 270), createKCF, 6),
+                  ((320, 180), createKCF, 8) ]
+
+class QualityController(object):
+    #Watches the time between game ticks against a budget and steps the
+    #tracking quality down when ticks run over it and back up when they are
+    #well under it. Stepping down takes a short run of slow ticks and
+    #stepping up a long run of fast ones, and the average starts over after
+    #every step, so the level doesn't flip back and forth. Gaps longer than
+    #maxGap (menus, selecting items) are not counted as ticks.
+    def __init__(self, budget=1/60, levels=qualityLevels, headroom=0.6,
+                 degradeAfter=15, improveAfter=180, maxGap=0.5):
+        self.budget = budget
+        self.levels = levels
+        self.headroom = headroom #fraction of the budget that counts as fast
+        self.degradeAfter = degradeAfter
+        self.improveAfter = improveAfter
+        self.maxGap = maxGap
+        self.level = 0
+        self.average = None
+        self.slowTicks = 0
+        self.fastTicks = 0
+        self.lastTick = None
+
+    def tick(self):
+        #call once per game tick, returns True when the level changed
+        now = time.perf_counter()
+        period = None if self.lastTick is None else now - self.lastTick
+        self.lastTick = now
+        if period is None or period > self.maxGap:
+            return False
+        self.average = movingAverage(self.average, period)
+        if self.average > self.budget:
+            self.slowTicks += 1
+            self.fastTicks = 0
+        elif self.average < self.budget * self.headroom:
+            self.fastTicks += 1
+            self.slowTicks = 0
+        else:
+            self.slowTicks = self.fastTicks = 0
+        if (self.slowTicks >= self.degradeAfter and
+            self.level < len(self.levels) - 1):
+            return self.setLevel(self.level + 1)
+        elif self.fastTicks >= self.improveAfter and self.level > 0:
+            return self.setLevel(self.level - 1)
+        return False
+
+    def setLevel(self, level):
+        self.level = level
+        self.average = None
+        self.slowTicks = self.fastTicks = 0
+        return True
+
+    def settings(self):
+        return self.levels[self.level]
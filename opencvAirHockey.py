@@ -1,6 +1,11 @@
-import math, random
+import math, random, sys, time
 import cv2 as cv
 from cmu_112_graphics import *
+from airHockeyVision import *
+from airHockeyControls import *
+from airHockeyAI import *
+from airHockeyLevels import *
+from airHockeyReplay import *
 
 #All the opencv methods used in this project are referenced from
 #the official opencv-python docutation, link:
@@ -9,35 +14,15 @@ from cmu_112_graphics import *
 def distance(x0, y0, x1, y1):
     return ((x0 - x1) ** 2 + (y0 - y1) ** 2) ** 0.5
 
-def circleIntersects(x0, y0, x1, y1, r): 
-    #Special version for two equal radii circles
-    dist = distance(x0, y0, x1, y1)
-    return dist < 2 * r
-
-def xyToPolar(dx, dy):
-    #convert cartesian coor to polar coor
-    #theta range from 0 to 2pi, no negative angles
-    mag = (dx ** 2 + dy ** 2) ** 0.5
-    if dx == 0 and dy == 0:
-        return (0, 0)
-    elif dx == 0 and dy != 0:
-        if dy > 0:
-            return (mag, math.pi / 2)
-        else:
-            return (mag, 3 * math.pi / 2)
-    elif dx != 0 and dy == 0:
-        if dx > 0:
-            return (mag, 0)
-        else:
-            return (mag, math.pi)
-    else:
-        theta = math.atan(dy / dx)
-        if dx < 0:
-            theta += math.pi
-        elif dx > 0 and dy < 0:
-            theta += 2 * math.pi
-        return (mag, theta)
-    
+def speedLimit(entity):
+    #clamps an entity's dx and dy to its maxSpeed in place, for the puck and
+    #the mallets alike
+    maxSpeed = entity.maxSpeed
+    if abs(entity.dx) > maxSpeed:
+        entity.dx = math.copysign(maxSpeed, entity.dx)
+    if abs(entity.dy) > maxSpeed:
+        entity.dy = math.copysign(maxSpeed, entity.dy)
+
 def getMiddle(bbox):
     #get middle coor of an opencv rectangle
     x, y, w, h = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
@@ -54,7 +39,62 @@ def drawBox(frame, bbox, color):
     x, y, w, h = int(bbox[0]), int(bbox[1]), int(bbox[2]), int(bbox[3])
     cv.rectangle(frame, (x, y), (x + w, y + h), fill, 3, 1)
 
+def showCamera(mode, frame):
+    #the camera window, left out when the app runs without one
+    if mode.app.showCamera:
+        cv.imshow('Tracking', frame)
+
+def cameraKey(mode):
+    #key pressed in the camera window, -1 when there is no camera window
+    if mode.app.showCamera:
+        return cv.waitKey(1)
+    return -1
+
+def openSource(mode):
+    #the app's frame source, the mouse and keyboard controls need its input
+    if mode.app.frameSource in controls:
+        return controls[mode.app.frameSource](mode.app.input)
+    return openFrameSource(mode.app.frameSource)
+
+def recordTick(mode, kind, pucks):
+    #draws the seed of the tick's random numbers into mode.rng and records
+    #the tick, a match's recording starts with its first tick
+    seed = random.getrandbits(32)
+    mode.rng.seed(seed)
+    if mode.app.replayWriter is None:
+        return
+    if mode.recorder is None:
+        mode.recorder = ReplayRecorder(mode.app.replayWriter,
+                                       replayPath(mode.app.replays, kind),
+                                       kind, mode.width, mode.height,
+                                       mode.friction, pucks)
+    mode.recorder.record(mode.leftMallet, mode.rightMallet, seed, pucks)
+
+def stopRecording(mode):
+    #the match is over or was left, the rest of it goes to the writer
+    if getattr(mode, 'recorder', None) is not None:
+        mode.recorder.close()
+    mode.recorder = None
+
+def handPlayer(mode):
+    #player index of the one player modes, 0 is the left player
+    return 0 if mode.hand == 'Left' else 1
+
+def newTracker(mode):
+    #a motion gated FlowTracker set up for the current tracking quality
+    size, createTracker, maxStride = mode.app.quality.settings()
+    return MotionGate(FlowTracker(createTracker, maxStride))
+
+#the physics moves things once a tick and is tuned for this many ticks a
+#second, velocities measured in px/second get to it through this
+physicsRate = 60
+
 class Mallet(object):
+    #Slots instead of a __dict__ for the entities the physics reads every
+    #tick: attribute access is a fixed offset and an entity is smaller.
+    #Subclasses that keep more state than MalletAI get a __dict__ back.
+    __slots__ = ('x', 'y', 'dx', 'dy', 'r', 'maxSpeed', 'velocity')
+
     def __init__(self, x, y, dx, dy):
         self.x = x
         self.y = y
@@ -62,13 +102,26 @@ class Mallet(object):
         self.dy = dy
         self.r = 50
         self.maxSpeed = 50
+        self.velocity = VelocityEstimator()
+    
+    def track(self, x, y, timestamp):
+        #a tracked mallet was seen at x, y on the frame captured at
+        #timestamp, its velocity comes from the capture times and not from
+        #how far it got since the last tick
+        self.velocity.add(timestamp, x, y)
+        vx, vy = self.velocity.velocity()
+        self.dx, self.dy = vx / physicsRate, vy / physicsRate
+        self.fixMalletSpeed()
+
+    def lose(self):
+        #the tracked item was lost or is selected again, the velocity
+        #starts over from the next time it's seen and the mallet stops
+        self.velocity.reset()
+        self.dx, self.dy = 0, 0
     
     def fixMalletSpeed(self):
         #can't exceed max speed, on both xy directions
-        if abs(self.dx) > self.maxSpeed:
-            self.dx = (self.maxSpeed * abs(self.dx) / self.dx)
-        if abs(self.dy) > self.maxSpeed:
-            self.dy = (self.maxSpeed * abs(self.dy) / self.dy)
+        speedLimit(self)
     
     def fixPosition(self, w1, w2, height):
         #mallet can't go off the screen
@@ -95,20 +148,19 @@ class Mallet(object):
             self.y += distY
 
 class Puck(object):
-    def __init__(self, x, y, dx, dy):
+    __slots__ = ('x', 'y', 'dx', 'dy', 'r', 'maxSpeed')
+
+    def __init__(self, x, y, dx, dy, r=50):
         self.x = x
         self.y = y
         self.dx = dx
         self.dy = dy
-        self.r = 50
+        self.r = r
         self.maxSpeed = 50
     
     def fixPuckSpeed(self):
         #can't exceed max speed
-        if abs(self.dx) > self.maxSpeed:
-            self.dx = (self.maxSpeed * abs(self.dx) / self.dx)
-        if abs(self.dy) > self.maxSpeed:
-            self.dy = (self.maxSpeed * abs(self.dy) / self.dy)
+        speedLimit(self)
     
     def applyFriction(self, friction):
         #apply the impact of friction on the velocity in both xy directions
@@ -147,44 +199,141 @@ class Puck(object):
     def puckRebound(self, mallet):
         #this method deals with the collision between mallet and puck
         #lots of physics here
-        if circleIntersects(mallet.x, mallet.y, self.x, self.y, self.r):
-            bounced = True
-            ratio = 2 * self.r / distance(mallet.x, mallet.y, self.x, self.y)
-            self.x = (mallet.x + ratio * (self.x - mallet.x))
-            self.y = (mallet.y + ratio * (self.y - mallet.y))
-            posDx = self.x - mallet.x
-            posDy = self.y - mallet.y
-            posMag, posTheta = xyToPolar(posDx, posDy)
-            puckMag, puckTheta = xyToPolar(self.dx, self.dy)
-            malletMag, malletTheta = xyToPolar(mallet.dx, mallet.dy)
-            paraMag = (-puckMag * math.cos(posTheta - puckTheta)
-                    + 2 * malletMag * math.cos(posTheta - malletTheta))
-            if paraMag < 0: return
-            perpMag = (puckMag * math.sin(posTheta - puckTheta)
-                    + malletMag * math.sin(posTheta - malletTheta))
-            self.dx = (paraMag * math.cos(posTheta) + 
-                        perpMag * math.cos(posTheta + math.pi / 2))
-            self.dy = (paraMag * math.sin(posTheta) + 
-                        perpMag * math.sin(posTheta + math.pi / 2))
-            self.fixPuckSpeed()
+        #in vector form on plain floats: the polar angles the collision
+        #was worked out in come down to the parts of the velocities along
+        #the line between the centers (n) and across it (t)
+        posDx = self.x - mallet.x
+        posDy = self.y - mallet.y
+        reach = self.r + mallet.r
+        d2 = posDx * posDx + posDy * posDy
+        if d2 >= reach * reach: return
+        if d2 == 0: return #no direction to push the puck out in
+        dist = math.sqrt(d2)
+        nx, ny = posDx / dist, posDy / dist
+        self.x = mallet.x + reach * nx
+        self.y = mallet.y + reach * ny
+        paraMag = (-(self.dx * nx + self.dy * ny)
+                   + 2 * (mallet.dx * nx + mallet.dy * ny))
+        if paraMag < 0: return
+        perpMag = ((self.dx * ny - self.dy * nx)
+                   + (mallet.dx * ny - mallet.dy * nx))
+        self.dx = paraMag * nx - perpMag * ny
+        self.dy = paraMag * ny + perpMag * nx
+        self.fixPuckSpeed()
+    
+    def puckCollide(self, other):
+        #two pucks of the same weight: pushed apart along the line between
+        #the centers, and trading the parts of their velocities along it
+        #when they are moving toward each other
+        dx, dy = other.x - self.x, other.y - self.y
+        reach = self.r + other.r
+        d2 = dx * dx + dy * dy
+        if d2 >= reach * reach or d2 == 0: return
+        d = d2 ** 0.5
+        nx, ny = dx / d, dy / d
+        push = (reach - d) / 2
+        self.x -= nx * push
+        self.y -= ny * push
+        other.x += nx * push
+        other.y += ny * push
+        closing = (self.dx - other.dx) * nx + (self.dy - other.dy) * ny
+        if closing <= 0: return
+        self.dx -= closing * nx
+        self.dy -= closing * ny
+        other.dx += closing * nx
+        other.dy += closing * ny
+        self.fixPuckSpeed()
+        other.fixPuckSpeed()
     
     def move(self):
         self.x += self.dx
         self.y += self.dy
 
+class PuckGrid(object):
+    #Broadphase for many pucks: every puck goes in the grid cell of its
+    #center and cells are one puck diameter (2r) wide. Pucks touch when
+    #their centers are less than 2r apart, so a puck can only touch the
+    #pucks in its own cell and the eight around it; wider cells would only
+    #put more pairs in each neighborhood. Filling the grid and going over
+    #the pairs it gives costs about as much as the pucks.
+    def __init__(self, cellSize):
+        self.cellSize = cellSize
+        self.cells = {}
+
+    def fill(self, pucks):
+        self.cells = {}
+        size = self.cellSize
+        for puck in pucks:
+            key = (int(puck.x // size), int(puck.y // size))
+            if key in self.cells:
+                self.cells[key].append(puck)
+            else:
+                self.cells[key] = [puck]
+
+    def pairs(self):
+        #every pair of pucks in the same or neighboring cells, once, by
+        #only looking at half of the neighbors
+        cells = self.cells
+        for (cx, cy), cell in cells.items():
+            for i in range(len(cell) - 1):
+                for other in cell[i + 1:]:
+                    yield cell[i], other
+            for nx, ny in ((cx + 1, cy - 1), (cx + 1, cy), (cx + 1, cy + 1),
+                           (cx, cy + 1)):
+                neighbor = cells.get((nx, ny))
+                if neighbor is not None:
+                    for puck in cell:
+                        for other in neighbor:
+                            yield puck, other
+
+    def near(self, x, y, reach):
+        #pucks whose centers can be within reach of x, y
+        size = self.cellSize
+        for cx in range(int((x - reach) // size), int((x + reach) // size) + 1):
+            for cy in range(int((y - reach) // size),
+                            int((y + reach) // size) + 1):
+                cell = self.cells.get((cx, cy))
+                if cell is not None:
+                    yield from cell
+
+def stepPucks(pucks, mallets, friction, grid=None):
+    #one tick of any number of pucks: the mallets hit the pucks near them,
+    #pucks that touch bounce off each other, then friction and the move.
+    #Without a grid every pair is tested, which the benchmark compares to.
+    if grid is not None:
+        grid.fill(pucks)
+        for mallet in mallets:
+            reach = mallet.r + grid.cellSize / 2
+            for puck in grid.near(mallet.x, mallet.y, reach):
+                puck.puckRebound(mallet)
+        for puck, other in grid.pairs():
+            puck.puckCollide(other)
+    else:
+        for mallet in mallets:
+            for puck in pucks:
+                puck.puckRebound(mallet)
+        for i in range(len(pucks) - 1):
+            for other in pucks[i + 1:]:
+                pucks[i].puckCollide(other)
+    for puck in pucks:
+        puck.applyFriction(friction)
+        puck.move()
+
 class MalletAI(Mallet): #subclass of mallet
+    __slots__ = ('difficulty', 'attackSpeed', 'hand')
+
     def __init__(self, x, y, dx, dy, difficulty, hand):
         #inherents everything except maxSpeed
         super().__init__(x, y, dx, dy)
-        speedDict = { "Mild" : (20, 10),
-                      "Medium" : (25, 20),
-                      "Nightmare" : (30, 30),
-                      "CMU" : (50, 30) }
+        speedDict = difficultySpeeds
         #The dict about how difficulties are set up
         self.difficulty = difficulty
         self.maxSpeed = speedDict[difficulty][0]
         self.attackSpeed = speedDict[difficulty][1] 
         #attack speed is the minimum speed before the ai actively attacks
+        for attribute, value in difficultyParameters.get(difficulty,
+                                                         {}).items():
+            setattr(self, attribute, value)
         self.hand = hand #AI is on the opposite side of hand
                          #so if hand = left, the AI should be on the right
     
@@ -219,25 +368,175 @@ class MalletAI(Mallet): #subclass of mallet
         #it should technically never reach this method but just in case
         if self.x < puck.x and self.hand == 'Left':
             #move back with maximum speed
-            self.dy = -abs(puck.dy) / puck.dy * self.maxSpeed
+            self.dy = -math.copysign(self.maxSpeed, puck.dy)
             self.dx = self.maxSpeed
             self.x += self.dx
             self.y += self.dy
             return True
         elif self.x > puck.x and self.hand == 'Right':
-            self.dy = -abs(puck.dy) / puck.dy * self.maxSpeed
+            self.dy = -math.copysign(self.maxSpeed, puck.dy)
             self.dx = -self.maxSpeed
             self.x += self.dx
             self.y += self.dy
             return True
 
+class PredictiveAI(MalletAI):
+    #Plans on a PuckForecast instead of chasing the puck: of the points
+    #where the puck's path crosses a few lines in its half, and where it
+    #stops, it takes the first one it can get behind in time and strikes
+    #from there toward the other goal. When there is none it guards its
+    #goal where the puck is headed. The forecast is only made again when
+    #the puck stops following it, i.e. after a hit or a goal.
+    lines = [0.15, 0.35, 0.55, 0.75] #fractions of its half from the middle
+
+    def __init__(self, x, y, dx, dy, difficulty, hand, width, height,
+                 friction):
+        super().__init__(x, y, dx, dy, difficulty, hand)
+        self.width = width
+        self.height = height
+        self.friction = friction
+        self.forecast = None
+        self.forecastTick = 0
+        self.forecasts = 0 #how many were made, for the benchmarks
+
+    def updateForecast(self, puck):
+        self.forecastTick += 1
+        forecast = self.forecast
+        if forecast is not None and (forecast.complete or
+                                     self.forecastTick <= forecast.horizon):
+            x, y = forecast.position(self.forecastTick)
+            dx, dy = forecast.velocity(self.forecastTick)
+            if (abs(x - puck.x) + abs(y - puck.y) + abs(dx - puck.dx) +
+                abs(dy - puck.dy) < 1e-6):
+                return
+        self.forecast = PuckForecast(puck.x, puck.y, puck.dx, puck.dy,
+                                     self.friction, self.height, puck.r)
+        self.forecastTick = 0
+        self.forecasts += 1
+
+    def inHalf(self, x):
+        if self.hand == 'Left':
+            return x > self.width / 2
+        return x < self.width / 2
+
+    def strikePoint(self, x, y, puck):
+        #where to be to send a puck at x, y toward the other goal
+        goalX = 0 if self.hand == 'Left' else self.width
+        ux, uy = x - goalX, y - self.height / 2
+        length = (ux ** 2 + uy ** 2) ** 0.5 or 1
+        reach = self.r + puck.r
+        return x + ux / length * reach, y + uy / length * reach
+
+    def plan(self, puck):
+        #the point to head for this tick
+        forecast, now = self.forecast, self.forecastTick
+        side = 1 if self.hand == 'Left' else -1
+        candidates = []
+        for line in self.lines:
+            n = forecast.tickAtX(self.width / 2 * (1 + side * line))
+            if n is not None and n > now:
+                candidates.append(n)
+        if forecast.stopTick <= forecast.horizon:
+            candidates.append(max(forecast.stopTick, now + 1))
+        for n in sorted(candidates):
+            x, y = forecast.position(n)
+            if not self.inHalf(x):
+                continue
+            strikeX, strikeY = self.strikePoint(x, y, puck)
+            ticks = max(abs(strikeX - self.x), abs(strikeY - self.y))
+            if ticks <= self.maxSpeed * (n - now):
+                if n - now <= 2:
+                    #close enough, go through the puck to hit it hard
+                    return x, y
+                return strikeX, strikeY
+        #nothing to reach, guard the goal on the puck's line
+        goalX = self.width - 2 * self.r if side > 0 else 2 * self.r
+        n = forecast.tickAtX(goalX)
+        y = forecast.position(n)[1] if n is not None else puck.y
+        y = min(max(y, self.height / 4), self.height * 3 / 4)
+        return goalX, y
+
+    def move(self, puck):
+        self.updateForecast(puck)
+        x, y = self.plan(puck)
+        self.dx = min(max(x - self.x, -self.maxSpeed), self.maxSpeed)
+        self.dy = min(max(y - self.y, -self.maxSpeed), self.maxSpeed)
+        self.x += self.dx
+        self.y += self.dy
+
+class SearchAI(MalletAI):
+    #Picks every move with a LookaheadSearch over the puck and both
+    #mallets, the search never takes much more than budget seconds so a
+    #tick can't run long because of it
+    def __init__(self, x, y, dx, dy, difficulty, hand, width, height,
+                 friction, opponent, budget=0.003):
+        super().__init__(x, y, dx, dy, difficulty, hand)
+        self.opponent = opponent
+        self.search = LookaheadSearch(width, height, friction, self.r,
+                                      1 if hand == 'Left' else -1,
+                                      self.maxSpeed, budget)
+        self.root = [0.0] * 12
+
+    def move(self, puck):
+        other = self.opponent
+        self.root[:] = (puck.x, puck.y, puck.dx, puck.dy,
+                        self.x, self.y, self.dx, self.dy,
+                        other.x, other.y, other.dx, other.dy)
+        self.dx, self.dy = self.search.search(self.root)
+        self.x += self.dx
+        self.y += self.dy
+
+class PolicyAI(MalletAI):
+    #Looks every move up in the policy table built for its difficulty
+    #(python3 airHockeyAI.py policy Table), plays like MalletAI when there
+    #is no table for the game's physics
+    def __init__(self, x, y, dx, dy, difficulty, hand, width, height,
+                 friction):
+        super().__init__(x, y, dx, dy, difficulty, hand)
+        self.width = width
+        self.policy = loadPolicy(difficulty, width, height, friction, self.r)
+
+    def move(self, puck):
+        if self.policy is None:
+            return super().move(puck)
+        if self.hand == 'Left':
+            dx, dy = self.policy.move((puck.x, puck.y, puck.dx, puck.dy,
+                                       self.x, self.y))
+        else:
+            #the table is for the right side, look up the mirror image
+            dx, dy = self.policy.move((self.width - puck.x, puck.y,
+                                       -puck.dx, puck.dy,
+                                       self.width - self.x, self.y))
+            dx = -dx
+        self.dx, self.dy = dx, dy
+        self.x += self.dx
+        self.y += self.dy
+
+def makeMalletAI(difficulty, x, y, hand, width, height, friction, opponent):
+    #the AI mallet of a difficulty at x, y, on the other side of hand
+    if difficulty == 'Predict':
+        return PredictiveAI(x, y, 0, 0, difficulty, hand, width, height,
+                            friction)
+    elif difficulty == 'Table':
+        return PolicyAI(x, y, 0, 0, difficulty, hand, width, height, friction)
+    elif difficulty == 'Search':
+        return SearchAI(x, y, 0, 0, difficulty, hand, width, height,
+                        friction, opponent)
+    return MalletAI(x, y, 0, 0, difficulty, hand)
+
 class Rectangle(object):
-    def __init__(self, x, hand, height):
-        #the rectangles in pratice mode
+    __slots__ = ('x', 'hand', 'length', 'y', 'width', 'exist')
+
+    def __init__(self, x, hand, height, y=None, length=None):
+        #the rectangles in pratice mode, at a random place unless given
         self.x = x
         self.hand = hand
-        self.length = random.randint(150, height/2)
-        self.y = random.randint(0, height-self.length)
+        if length is None:
+            length = random.randint(150, height/2)
+        if y is None:
+            y = random.randint(0, height-length)
+        self.length = length
+        self.y = y
         self.width = 28
         self.exist = True
 
@@ -252,6 +551,63 @@ class Rectangle(object):
             puck.dx = -puck.dx
             self.exist = False #will disappear if hit
 
+class TargetIndex(object):
+    #The practice rectangles, bucketed by the rows of the table their hit
+    #bands cover and sorted in a row by how far toward the far side they
+    #are, so a tick only looks at the rectangles in the puck's row that
+    #the puck has reached, however many there are. The hit is the same as
+    #checking every rectangle in list order, and remaining counts the ones
+    #still standing without going over them.
+    def __init__(self, rectangles, hand, height, rowHeight=40):
+        self.rectangles = rectangles
+        self.hand = hand
+        self.rowHeight = rowHeight
+        self.rows = [[] for row in range(int(height // rowHeight) + 1)]
+        for index, rectangle in enumerate(rectangles):
+            if rectangle.exist:
+                for row in self.rowsOf(rectangle):
+                    row.append((self.front(rectangle.x), index))
+        for row in self.rows:
+            row.sort()
+        self.remaining = sum(rectangle.exist for rectangle in rectangles)
+
+    def front(self, x):
+        #grows toward the targets
+        return x if self.hand == 'Left' else -x
+
+    def rowsOf(self, rectangle):
+        #the rows the hit band of puckHits touches
+        first = max(0, int((rectangle.y - 20) // self.rowHeight))
+        last = min(len(self.rows) - 1,
+                   int((rectangle.y + rectangle.length + 20) //
+                       self.rowHeight))
+        return self.rows[first:last + 1]
+
+    def puckHits(self, puck):
+        #Rectangle.puckHits for every rectangle, one hit at most since the
+        #first one sends the puck back
+        if self.hand == 'Left':
+            if puck.dx <= 0: return
+            reach = self.front(puck.x + puck.r)
+        else:
+            if puck.dx >= 0: return
+            reach = self.front(puck.x - puck.r)
+        row = min(max(int(puck.y // self.rowHeight), 0), len(self.rows) - 1)
+        hit = None
+        for front, index in self.rows[row]:
+            if front > reach:
+                break
+            rectangle = self.rectangles[index]
+            if ((hit is None or index < hit) and rectangle.y - 20 < puck.y
+                < rectangle.y + rectangle.length + 20):
+                hit = index
+        if hit is not None:
+            rectangle = self.rectangles[hit]
+            rectangle.puckHits(puck)
+            self.remaining -= 1
+            for row in self.rowsOf(rectangle):
+                row.remove((self.front(rectangle.x), hit))
+
 class SplashScreenMode(Mode):
 #The background image is from the website:
 #https://www.walpaperlist.com/2020/01/wallpaper-white-gaming-background.html
@@ -260,9 +616,11 @@ class SplashScreenMode(Mode):
         mode.onePlayerColor = 'black'
         mode.twoPlayerColor = 'black'
         mode.practiceColor = 'black'
+        mode.partyColor = 'black'
         mode.onePlayerFill = 'white'
         mode.twoPlayerFill = 'white'
         mode.practiceFill = 'white'
+        mode.partyFill = 'white'
     
     def mouseMoved(mode, event):
         fontSize = 36
@@ -287,6 +645,13 @@ class SplashScreenMode(Mode):
         else:
             mode.practiceColor = 'black'
             mode.practiceFill = 'white'
+        if (mode.width/4+460 < event.x < mode.width/4+620
+        and mode.height * 2/5-30 < event.y < mode.height * 2/5+30):
+            mode.partyColor = 'white'
+            mode.partyFill = 'gray'
+        else:
+            mode.partyColor = 'black'
+            mode.partyFill = 'white'
     
     def mousePressed(mode, event):
         if (mode.width/4-80 < event.x < mode.width/4+80
@@ -298,6 +663,9 @@ class SplashScreenMode(Mode):
         elif (mode.width/4+280 < event.x < mode.width/4+440
         and mode.height * 4/5-30 < event.y < mode.height * 4/5+30):
             mode.app.setActiveMode(mode.app.practiceMode)    
+        elif (mode.width/4+460 < event.x < mode.width/4+620
+        and mode.height * 2/5-30 < event.y < mode.height * 2/5+30):
+            mode.app.setActiveMode(mode.app.partyMode)
         
     
     def redrawAll(mode, canvas):
@@ -321,11 +689,18 @@ class SplashScreenMode(Mode):
                             fill=mode.practiceFill, outline='black', width=5)
         canvas.create_text(mode.width/4+360, mode.height * 4/5, 
         text='Practice', fill = mode.practiceColor, font = font)
+        canvas.create_rectangle(mode.width/4+460, mode.height * 2/5-30,
+                                mode.width/4+620, mode.height * 2/5+30,
+                            fill=mode.partyFill, outline='black', width=5)
+        canvas.create_text(mode.width/4+540, mode.height * 2/5, 
+        text='Party', fill = mode.partyColor, font = font)
         canvas.create_text(5, mode.height-5, text='By: Shize Che', 
                            font=font, anchor='sw')
 
 class TwoPlayerMode(Mode):
     def appStarted(mode):
+        stopRecording(mode)
+        mode.rng = random.Random() #drawn from the tick's recorded seed
         mode.started = False
         TwoPlayerMode.trackStart(mode)
         mode.leftMallet = Mallet(50, mode.height/2, 0, 0)
@@ -340,9 +715,15 @@ class TwoPlayerMode(Mode):
         mode.timerDelay = 5  
 
     def trackStart(mode):
-        mode.cap = cv.VideoCapture(0)
-        mode.trackers = cv.MultiTracker_create()
+        if getattr(mode, 'cap', None) is not None:
+            mode.cap.release()
+        mode.cap = openSource(mode)
+        mode.mapper = mode.cap.makeMapper(mode.width, mode.height,
+                                          mode.app.quality.settings()[0])
+        mode.qualityLevel = mode.app.quality.level
+        mode.trackers = ParallelTrackers()
         mode.tracked = False
+        mode.trackerTime = None #seconds the last tracker update took
         mode.bbox1 = None
         mode.bbox2 = None
     
@@ -367,7 +748,9 @@ class TwoPlayerMode(Mode):
         elif (event.x >= mode.width-160 and event.x <= mode.width-40 and 
             event.y >= 0 and event.y <= 36):
             mode.tracked = False
-            mode.trackers = cv.MultiTracker_create()
+            mode.trackers = ParallelTrackers()
+            mode.leftMallet.lose()
+            mode.rightMallet.lose()
 
     def keyPressed(mode, event):
         #start a new game
@@ -378,51 +761,127 @@ class TwoPlayerMode(Mode):
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def setTracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (630, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
-        if cv.waitKey(1) == ord('t'):
+        mirroredFrame = mode.mapper.prepare(frame)
+        truthBoxes = mode.cap.truthBoxes(mode.mapper)
+        key = cameraKey(mode)
+        if key == ord('t'):
+            #the selected items replace whatever was tracking before
+            mode.trackers = ParallelTrackers()
             mode.bbox1 = cv.selectROI('Tracking', mirroredFrame, False) #<--
+            mode.app.templates.remember(0, mirroredFrame, mode.bbox1,
+                                        mode.mapper.size)
             drawBox(mirroredFrame, mode.bbox1, 'red')
-            tracker1 = cv.TrackerCSRT_create() #<--
+            tracker1 = newTracker(mode) #<--
             mode.trackers.add(tracker1, mirroredFrame, mode.bbox1) #<--
             mode.bbox2 = cv.selectROI('Tracking', mirroredFrame, False) #<--
+            mode.app.templates.remember(1, mirroredFrame, mode.bbox2,
+                                        mode.mapper.size)
             drawBox(mirroredFrame, mode.bbox2, 'blue')
-            tracker2 = cv.TrackerCSRT_create() #<--
+            tracker2 = newTracker(mode) #<--
             mode.trackers.add(tracker2, mirroredFrame, mode.bbox2) #<--
             mode.tracked = True
             mode.started = True
-        cv.imshow('Tracking', mirroredFrame) #<--
+        elif key == ord('k'):
+            #click the four table corners to calibrate an angled camera
+            mode.mapper.calibrate('Tracking', frame)
+            return
+        elif key == ord('a'):
+            #printed aruco markers 0 (left) and 1 (right), nothing to select
+            mode.bbox1, mode.bbox2 = None, None
+            mode.trackers = ParallelTrackers()
+            mode.trackers.add(MotionGate(ArucoTracker(0)), mirroredFrame,
+                              None)
+            mode.trackers.add(MotionGate(ArucoTracker(1)), mirroredFrame,
+                              None)
+        elif key == ord('c'):
+            #red paddle on the left, blue paddle on the right
+            mode.bbox1, mode.bbox2 = None, None
+            mode.trackers = ColorTracker(['red', 'blue'])
+        elif mode.cap.remote and mode.trackers.needsSelection:
+            #the vision process tracks both players
+            mode.bbox1, mode.bbox2 = None, None
+            mode.trackers = RemoteTrackers(mode.cap)
+        elif truthBoxes is not None and mode.trackers.needsSelection:
+            #synthetic frames know where the objects are, nothing to select
+            mode.bbox1, mode.bbox2 = truthBoxes[0], truthBoxes[1]
+            mode.trackers = ParallelTrackers()
+            mode.trackers.add(newTracker(mode), mirroredFrame, mode.bbox1)
+            mode.trackers.add(newTracker(mode), mirroredFrame, mode.bbox2)
+            mode.tracked = True
+            mode.started = True
+        elif (mode.trackers.needsSelection and mode.app.templates.has(0) and
+              mode.app.templates.has(1)):
+            #look for what was selected last time, nothing to select
+            bbox1 = mode.app.templates.find(0, mirroredFrame, mode.mapper.size)
+            bbox2 = mode.app.templates.find(1, mirroredFrame, mode.mapper.size)
+            if bbox1 is not None and bbox2 is not None:
+                mode.bbox1, mode.bbox2 = bbox1, bbox2
+                mode.trackers = ParallelTrackers()
+                mode.trackers.add(newTracker(mode), mirroredFrame, bbox1)
+                mode.trackers.add(newTracker(mode), mirroredFrame, bbox2)
+                mode.tracked = True
+                mode.started = True
+        if not mode.trackers.needsSelection:
+            ret, boxes = mode.trackers.update(mirroredFrame)
+            if ret:
+                mode.bbox1, mode.bbox2 = boxes[0], boxes[1]
+                mode.tracked = True
+                mode.started = True
+        showCamera(mode, mirroredFrame) #<--
 
     #lines end with <-- are copied/modified from this youtube video:
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def tracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (640, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
+        mode.app.probe.start(mode.cap.captureTime)
+        if mode.qualityLevel != mode.app.quality.level:
+            TwoPlayerMode.retune(mode, frame)
+        mirroredFrame = mode.mapper.prepare(frame)
+        mode.app.probe.mark('prepare')
+        start = time.perf_counter()
         ret, boxes = mode.trackers.update(mirroredFrame) #<--
-        mode.bbox1, mode.bbox2 = boxes[0], boxes[1]
-        leftX, leftY = getMiddle(mode.bbox1)
-        rightX, rightY = getMiddle(mode.bbox2)
-        mode.leftMallet.dx, mode.leftMallet.dy=(leftX*2-mode.leftMallet.x, 
-                                                leftY*2-mode.leftMallet.y)
-        mode.rightMallet.dx, mode.rightMallet.dy=(rightX*2-mode.rightMallet.x, 
-                                                  rightY*2-mode.rightMallet.y)
-        mode.leftMallet.fixMalletSpeed()
-        mode.rightMallet.fixMalletSpeed()
+        mode.trackerTime = time.perf_counter() - start
+        mode.app.probe.mark('track')
         if ret: #<--
+            #a lost track hands back empty boxes, keep the last good ones
+            mode.bbox1, mode.bbox2 = boxes[0], boxes[1]
+            leftX, leftY = mode.mapper.toWindow(*getMiddle(mode.bbox1))
+            rightX, rightY = mode.mapper.toWindow(*getMiddle(mode.bbox2))
+            mode.leftMallet.track(leftX, leftY, mode.cap.timestamp)
+            mode.rightMallet.track(rightX, rightY, mode.cap.timestamp)
             drawBox(mirroredFrame, mode.bbox1, 'red') #<--
             drawBox(mirroredFrame, mode.bbox2, 'blue') #<--
         else:
             #it might lose track, so set the track again
             mode.tracked = False
-            mode.trackers = cv.MultiTracker_create()
+            mode.leftMallet.lose()
+            mode.rightMallet.lose()
+            if mode.trackers.needsSelection:
+                mode.trackers = ParallelTrackers()
             return
-        cv.imshow('Tracking', mirroredFrame) #<--
-        mode.leftMallet.move(leftX*2, leftY*2)
-        mode.rightMallet.move(rightX*2, rightY*2)
+        showCamera(mode, mirroredFrame) #<--
+        mode.leftMallet.move(leftX, leftY)
+        mode.rightMallet.move(rightX, rightY)
         mode.leftMallet.fixPosition(0, mode.width/2, mode.height)
         mode.rightMallet.fixPosition(mode.width/2, mode.width, mode.height)
     
+    def retune(mode, frame):
+        #follow the quality controller to another frame size or tracker
+        size, createTracker, maxStride = mode.app.quality.settings()
+        mode.bbox1 = scaleBox(mode.bbox1, mode.mapper.size, size)
+        mode.bbox2 = scaleBox(mode.bbox2, mode.mapper.size, size)
+        mode.mapper.resize(size)
+        if mode.trackers.needsSelection and (emptyBox(mode.bbox1) or
+                                             emptyBox(mode.bbox2)):
+            #no good box to start the trackers from, select again
+            mode.trackers = ParallelTrackers()
+            mode.tracked = False
+        else:
+            mode.trackers.retune(mode.mapper.prepare(frame),
+                                 [mode.bbox1, mode.bbox2], createTracker,
+                                 maxStride)
+        mode.qualityLevel = mode.app.quality.level
+
     def checkEdge(mode):
         #check if any player scores and apply puckHitsEdge method
         if mode.puck.x < 0:
@@ -437,24 +896,33 @@ class TwoPlayerMode(Mode):
     
     def checkScore(mode):
         #check if anyone wins
-        if mode.leftScore == 6:
+        if mode.leftScore >= 6:
             mode.leftWin = True
             mode.done = True
-        elif mode.rightScore == 6:
+        elif mode.rightScore >= 6:
             mode.rightWin = True
             mode.done = True
         
+    def physics(mode):
+        #everything after the mallets have moved, a replay runs this too
+        mode.puck.puckRebound(mode.leftMallet)
+        mode.puck.puckRebound(mode.rightMallet)
+        mode.puck.applyFriction(mode.friction)
+        mode.puck.move()
+        TwoPlayerMode.checkEdge(mode)
+        TwoPlayerMode.checkScore(mode)
+
     def timerFired(mode):
         if not mode.done and not mode.tracked:
             TwoPlayerMode.setTracking(mode)
         elif not mode.done and mode.tracked:
+            mode.app.quality.tick()
             TwoPlayerMode.tracking(mode)
-            mode.puck.puckRebound(mode.leftMallet)
-            mode.puck.puckRebound(mode.rightMallet)
-            mode.puck.applyFriction(mode.friction)
-            mode.puck.move()
-            TwoPlayerMode.checkEdge(mode)
-            TwoPlayerMode.checkScore(mode)
+            recordTick(mode, 'TwoPlayer', [mode.puck])
+            TwoPlayerMode.physics(mode)
+            if mode.done:
+                stopRecording(mode)
+            mode.app.probe.mark('physics')
     
     def drawBoard(mode, canvas):
         canvas.create_oval(mode.width/2 - 80, mode.height/2 - 80, 
@@ -477,9 +945,10 @@ class TwoPlayerMode(Mode):
             instruction = "Go to the camera window,\n\
 hold the items you want to\n\
 use to control your mallet,\n\
-press 't' and select the item"
-            canvas.create_rectangle(mode.width/2-220, mode.height/2-100,
-                                    mode.width/2+220, mode.height/2+100,
+press 't' and select the item\n\
+or 'a' for aruco markers"
+            canvas.create_rectangle(mode.width/2-220, mode.height/2-125,
+                                    mode.width/2+220, mode.height/2+125,
                                     fill='white', outline='black', width=5)
             canvas.create_text(mode.width/2, mode.height/2, text=instruction,
                                font="Times 36")
@@ -489,7 +958,7 @@ press 't' and select the item"
                            text = f'{mode.leftScore}   vs   {mode.rightScore}',
                            font = "Arial 36", anchor = 'n')
         if mode.done:
-            if mode.leftScore == 6:
+            if mode.leftScore >= 6:
                 leftText, rightText = 'You Won!', 'You Lost!'
             else:
                 leftText, rightText = 'You Lost!', 'You Won!'
@@ -551,24 +1020,116 @@ press 't' and select the item"
         TwoPlayerMode.drawMenuRetrack(mode, canvas)
         TwoPlayerMode.drawWarning(mode, canvas)
         TwoPlayerMode.drawInstruction(mode, canvas)
+
+class PartyMode(TwoPlayerMode):
+    #Two players and a table full of pucks that bounce off each other,
+    #every puck that goes in scores and comes back on the middle line.
+    #Tracking and scoring are two-player mode's.
+    puckCount = 8
+    puckRadius = 30
+
+    def appStarted(mode):
+        TwoPlayerMode.appStarted(mode)
+        PartyMode.rackPucks(mode, PartyMode.puckCount, PartyMode.puckRadius)
+
+    def rackPucks(mode, count, r):
+        #the pucks in a line down the middle
+        mode.pucks = [Puck(mode.width/2, (i + 0.5) * mode.height / count,
+                           0, 0, r) for i in range(count)]
+        mode.grid = PuckGrid(2 * r)
+
+    def mousePressed(mode, event):
+        #clicked on clickables
+        if (event.x >= 40 and event.x <= 140 and 
+            event.y >= 0 and event.y <= 36):
+            PartyMode.appStarted(mode)
+            mode.app.setActiveMode(mode.app.splashScreenMode)
+        elif (event.x >= mode.width-160 and event.x <= mode.width-40 and 
+            event.y >= 0 and event.y <= 36):
+            mode.tracked = False
+            mode.trackers = ParallelTrackers()
+            mode.leftMallet.lose()
+            mode.rightMallet.lose()
+
+    def keyPressed(mode, event):
+        #start a new game
+        if mode.done and event.key == 'n':
+            PartyMode.appStarted(mode)
+
+    def checkEdge(mode):
+        #every puck that went in scores and comes back somewhere on the
+        #middle line, so pucks that come back together don't overlap
+        for puck in mode.pucks:
+            if puck.x < 0 or puck.x > mode.width:
+                if puck.x < 0:
+                    mode.rightScore += 1
+                else:
+                    mode.leftScore += 1
+                puck.x = mode.width/2
+                puck.y = mode.rng.uniform(puck.r, mode.height - puck.r)
+                puck.dx, puck.dy = 0, 0
+            puck.puckHitsEdge(mode.height)
+
+    def timerFired(mode):
+        if not mode.done and not mode.tracked:
+            TwoPlayerMode.setTracking(mode)
+        elif not mode.done and mode.tracked:
+            mode.app.quality.tick()
+            TwoPlayerMode.tracking(mode)
+            recordTick(mode, 'Party', mode.pucks)
+            PartyMode.physics(mode)
+            if mode.done:
+                stopRecording(mode)
+            mode.app.probe.mark('physics')
+
+    def physics(mode):
+        stepPucks(mode.pucks, [mode.leftMallet, mode.rightMallet],
+                  mode.friction, mode.grid)
+        PartyMode.checkEdge(mode)
+        TwoPlayerMode.checkScore(mode)
+
+    def drawPuck(mode, canvas):
+        for puck in mode.pucks:
+            canvas.create_oval(puck.x - puck.r, puck.y - puck.r,
+                               puck.x + puck.r, puck.y + puck.r,
+                               fill = "black")
+
+    def redrawAll(mode, canvas):
+        TwoPlayerMode.drawBoard(mode, canvas)
+        TwoPlayerMode.drawLeftMallet(mode, canvas)
+        PartyMode.drawPuck(mode, canvas)
+        TwoPlayerMode.drawRightMallet(mode, canvas)
+        TwoPlayerMode.drawScore(mode, canvas)
+        TwoPlayerMode.drawMenuRetrack(mode, canvas)
+        TwoPlayerMode.drawWarning(mode, canvas)
+        TwoPlayerMode.drawInstruction(mode, canvas)
     
 class OnePlayerMode(Mode):
 #background image is from the website:
 #https://sensientpharma.com/white-marble-texture-in-natural-pattern-with-
 #high-resolution-for-background-and-design-art-work-white-stone-floor-2/
     def appStarted(mode):
+        stopRecording(mode)
+        mode.rng = random.Random() #drawn from the tick's recorded seed
         mode.background = mode.loadImage('marble.jpg')
         mode.started = False
         mode.difficulty = None
         mode.hand = None
         mode.diffColor = {'Mild' : 'black', 'Medium' : 'black',
-                          'Nightmare' : 'black', 'CMU' : 'black'}
+                          'Nightmare' : 'black', 'CMU' : 'black',
+                          'Predict' : 'black', 'Search' : 'black',
+                          'Table' : 'black'}
         mode.handColor = {'Left' : 'black', 'Right' : 'black',
                           'Go' : 'black'}
         mode.selected = False
         OnePlayerMode.trackStart(mode)
         mode.puck = Puck(mode.width/2, mode.height/2, 0, 0)
         mode.friction = 0.5
+        #without a policy table Table would just be Nightmare, so it can't
+        #be picked until the table is built
+        mode.tableReady = OnePlayerMode.tableReady(mode)
+        if not mode.tableReady:
+            mode.diffColor['Table'] = 'light gray'
         mode.leftScore = 0
         mode.rightScore = 0
         mode.menuColor = 'black'
@@ -581,18 +1142,33 @@ class OnePlayerMode(Mode):
         if mode.hand != None and mode.difficulty != None:
             if mode.hand == 'Left':
                 mode.leftMallet = Mallet(50, mode.height/2, 0, 0)
-                mode.rightMallet = MalletAI(mode.width-50, mode.height/2, 
-                                            0, 0, mode.difficulty, mode.hand)
+                mode.rightMallet = OnePlayerMode.makeAI(mode, mode.width-50,
+                                                        mode.leftMallet)
             else:
                 mode.rightMallet = Mallet(mode.width-50, mode.height/2, 0, 0)
-                mode.leftMallet = MalletAI(50, mode.height/2, 
-                                        0, 0, mode.difficulty, mode.hand)
+                mode.leftMallet = OnePlayerMode.makeAI(mode, 50,
+                                                       mode.rightMallet)
             mode.selected = True
     
+    def playerMallet(mode):
+        #the tracked mallet, the AI has the other one
+        return mode.leftMallet if mode.hand == 'Left' else mode.rightMallet
+
+    def makeAI(mode, x, opponent):
+        #the AI mallet for the chosen difficulty, on the other side of hand
+        return makeMalletAI(mode.difficulty, x, mode.height/2, mode.hand,
+                            mode.width, mode.height, mode.friction, opponent)
+
     def trackStart(mode):
-        mode.cap = cv.VideoCapture(0)
-        mode.tracker = cv.TrackerCSRT_create()
+        if getattr(mode, 'cap', None) is not None:
+            mode.cap.release()
+        mode.cap = openSource(mode)
+        mode.mapper = mode.cap.makeMapper(mode.width, mode.height,
+                                          mode.app.quality.settings()[0])
+        mode.qualityLevel = mode.app.quality.level
+        mode.tracker = newTracker(mode)
         mode.tracked = False
+        mode.trackerTime = None #seconds the last tracker update took
         mode.bbox = None
     
     def keyPressed(mode, event):
@@ -619,6 +1195,18 @@ class OnePlayerMode(Mode):
                 if OnePlayerMode.inCMU(mode, event.x, event.y):
                     mode.diffColor['CMU'] = 'gray'
                 else: mode.diffColor['CMU'] = 'black'
+            if mode.diffColor['Predict'] != 'red':
+                if OnePlayerMode.inPredict(mode, event.x, event.y):
+                    mode.diffColor['Predict'] = 'gray'
+                else: mode.diffColor['Predict'] = 'black'
+            if mode.diffColor['Search'] != 'red':
+                if OnePlayerMode.inSearch(mode, event.x, event.y):
+                    mode.diffColor['Search'] = 'gray'
+                else: mode.diffColor['Search'] = 'black'
+            if mode.tableReady and mode.diffColor['Table'] != 'red':
+                if OnePlayerMode.inTable(mode, event.x, event.y):
+                    mode.diffColor['Table'] = 'gray'
+                else: mode.diffColor['Table'] = 'black'
             if mode.handColor['Left'] != 'red':
                 if OnePlayerMode.inLeft(mode, event.x, event.y):
                     mode.handColor['Left'] = 'gray'
@@ -657,6 +1245,16 @@ class OnePlayerMode(Mode):
             elif OnePlayerMode.inCMU(mode, event.x, event.y):
                 OnePlayerMode.diffBlack(mode)
                 mode.diffColor['CMU'] = 'red'
+            elif OnePlayerMode.inPredict(mode, event.x, event.y):
+                OnePlayerMode.diffBlack(mode)
+                mode.diffColor['Predict'] = 'red'
+            elif OnePlayerMode.inSearch(mode, event.x, event.y):
+                OnePlayerMode.diffBlack(mode)
+                mode.diffColor['Search'] = 'red'
+            elif (mode.tableReady and
+                  OnePlayerMode.inTable(mode, event.x, event.y)):
+                OnePlayerMode.diffBlack(mode)
+                mode.diffColor['Table'] = 'red'
             elif OnePlayerMode.inLeft(mode, event.x, event.y):
                 OnePlayerMode.handBlack(mode)
                 mode.handColor['Left'] = 'red'
@@ -673,18 +1271,26 @@ class OnePlayerMode(Mode):
             elif (event.x >= mode.width-160 and event.x <= mode.width-40 and 
                 event.y >= 0 and event.y <= 36):
                 mode.tracked = False
-                mode.tracker = cv.TrackerCSRT_create()
+                mode.tracker = newTracker(mode)
+                OnePlayerMode.playerMallet(mode).lose()
     
     def diffBlack(mode):
         #turn all colors into black, since only one color can be red
         for diff in mode.diffColor:
             mode.diffColor[diff] = 'black'
+        if not mode.tableReady:
+            mode.diffColor['Table'] = 'light gray'
     
     def handBlack(mode):
         #same purpose as diffBlack
         for hand in mode.handColor:
             mode.handColor[hand] = 'black'
 
+    def tableReady(mode):
+        #whether the Table AI has a policy table for this game's physics
+        return loadPolicy('Table', mode.width, mode.height, mode.friction,
+                          Mallet(0, 0, 0, 0).r) is not None
+
     def setDiffHand(mode):
         #set difficulty and hand when clicked on Go
         for diff in mode.diffColor:
@@ -705,45 +1311,108 @@ class OnePlayerMode(Mode):
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def setTracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (630, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
-        if cv.waitKey(1) == ord('t'):
+        mirroredFrame = mode.mapper.prepare(frame)
+        truthBoxes = mode.cap.truthBoxes(mode.mapper)
+        key = cameraKey(mode)
+        if key == ord('t'):
             mode.bbox = cv.selectROI('Tracking', mirroredFrame, False) #<--
+            mode.app.templates.remember(handPlayer(mode), mirroredFrame,
+                                        mode.bbox, mode.mapper.size)
+            #the selected item replaces an aruco or color tracker
+            mode.tracker = newTracker(mode)
             mode.tracker.init(mirroredFrame, mode.bbox) #<--
             mode.tracked = True
             mode.started = True
-        cv.imshow('Tracking', mirroredFrame) #<--
+        elif key == ord('k'):
+            #click the four table corners to calibrate an angled camera
+            mode.mapper.calibrate('Tracking', frame)
+            return
+        elif key == ord('a'):
+            #printed aruco marker 0, nothing to select
+            mode.bbox = None
+            mode.tracker = MotionGate(ArucoTracker(0))
+        elif key == ord('c'):
+            #red paddle, nothing to select
+            mode.bbox = None
+            mode.tracker = SingleColorTracker('red')
+        elif mode.cap.remote and mode.tracker.needsSelection:
+            #the vision process tracks the players, left one first
+            mode.bbox = None
+            mode.tracker = RemoteTrackers(mode.cap, handPlayer(mode))
+        elif truthBoxes is not None and mode.tracker.needsSelection:
+            #synthetic frames know where the objects are, nothing to select
+            if mode.hand == 'Left':
+                mode.bbox = truthBoxes[0]
+            else:
+                mode.bbox = truthBoxes[-1]
+            mode.tracker.init(mirroredFrame, mode.bbox)
+            mode.tracked = True
+            mode.started = True
+        elif (mode.tracker.needsSelection and
+              mode.app.templates.has(handPlayer(mode))):
+            #look for what was selected last time, nothing to select
+            bbox = mode.app.templates.find(handPlayer(mode), mirroredFrame,
+                                           mode.mapper.size)
+            if bbox is not None:
+                mode.bbox = bbox
+                mode.tracker.init(mirroredFrame, mode.bbox)
+                mode.tracked = True
+                mode.started = True
+        if not mode.tracker.needsSelection:
+            ret, bbox = mode.tracker.update(mirroredFrame)
+            if ret:
+                mode.bbox = bbox
+                mode.tracked = True
+                mode.started = True
+        showCamera(mode, mirroredFrame) #<--
     
     #lines end with <-- are copied/modified from this youtube video:
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def tracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (640, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
-        ret, mode.bbox = mode.tracker.update(mirroredFrame) #<--
-        x, y = getMiddle(mode.bbox)
-        if mode.hand == 'Left':
-            mode.leftMallet.dx = x * 2 - mode.leftMallet.x 
-            mode.leftMallet.dy = y * 2 - mode.leftMallet.y
-            mode.leftMallet.fixMalletSpeed()
-        else:
-            mode.rightMallet.dx = x * 2 - mode.rightMallet.x 
-            mode.rightMallet.dy = y * 2 - mode.rightMallet.y
-            mode.rightMallet.fixMalletSpeed()
+        mode.app.probe.start(mode.cap.captureTime)
+        if mode.qualityLevel != mode.app.quality.level:
+            OnePlayerMode.retune(mode, frame)
+        mirroredFrame = mode.mapper.prepare(frame)
+        mode.app.probe.mark('prepare')
+        start = time.perf_counter()
+        ret, bbox = mode.tracker.update(mirroredFrame) #<--
+        mode.trackerTime = time.perf_counter() - start
+        mode.app.probe.mark('track')
         if ret: #<--
+            #a lost track hands back an empty box, keep the last good one
+            mode.bbox = bbox
+            x, y = mode.mapper.toWindow(*getMiddle(mode.bbox))
+            OnePlayerMode.playerMallet(mode).track(x, y, mode.cap.timestamp)
             drawBox(mirroredFrame, mode.bbox, 'red') #<--
         else:
             mode.tracked = False
-            mode.tracker = cv.TrackerCSRT_create()
+            OnePlayerMode.playerMallet(mode).lose()
+            if mode.tracker.needsSelection:
+                mode.tracker = newTracker(mode)
             return
-        cv.imshow('Tracking', mirroredFrame) #<--
+        showCamera(mode, mirroredFrame) #<--
         if mode.hand == 'Left':
-            mode.leftMallet.move(x * 2, y * 2)
+            mode.leftMallet.move(x, y)
             mode.leftMallet.fixPosition(0, mode.width/2, mode.height)
         else:
-            mode.rightMallet.move(x * 2, y * 2)
+            mode.rightMallet.move(x, y)
             mode.rightMallet.fixPosition(mode.width/2, mode.width, mode.height)
     
+    def retune(mode, frame):
+        #follow the quality controller to another frame size or tracker
+        size, createTracker, maxStride = mode.app.quality.settings()
+        mode.bbox = scaleBox(mode.bbox, mode.mapper.size, size)
+        mode.mapper.resize(size)
+        if mode.tracker.needsSelection and emptyBox(mode.bbox):
+            #no good box to start the tracker from, select again
+            mode.tracker = newTracker(mode)
+            mode.tracked = False
+        else:
+            mode.tracker.retune(mode.mapper.prepare(frame), mode.bbox,
+                                createTracker, maxStride)
+        mode.qualityLevel = mode.app.quality.level
+
     def timerFired(mode):
         if not mode.selected:
             OnePlayerMode.selectStart(mode)
@@ -751,6 +1420,7 @@ class OnePlayerMode(Mode):
             if not mode.done and not mode.tracked:
                 OnePlayerMode.setTracking(mode)
             elif not mode.done and mode.tracked:
+                mode.app.quality.tick()
                 OnePlayerMode.tracking(mode)
                 if mode.hand == 'Left':
                     mode.rightMallet.move(mode.puck)
@@ -759,12 +1429,20 @@ class OnePlayerMode(Mode):
                 else:
                     mode.leftMallet.move(mode.puck)
                     mode.leftMallet.fixPosition(0, mode.width/2, mode.height)
-                mode.puck.puckRebound(mode.leftMallet)
-                mode.puck.puckRebound(mode.rightMallet)
-                mode.puck.applyFriction(mode.friction)
-                mode.puck.move()
-                OnePlayerMode.checkEdge(mode)
-                OnePlayerMode.checkScore(mode)
+                recordTick(mode, 'OnePlayer', [mode.puck])
+                OnePlayerMode.physics(mode)
+                if mode.done:
+                    stopRecording(mode)
+                mode.app.probe.mark('physics')
+
+    def physics(mode):
+        #everything after the mallets have moved, a replay runs this too
+        mode.puck.puckRebound(mode.leftMallet)
+        mode.puck.puckRebound(mode.rightMallet)
+        mode.puck.applyFriction(mode.friction)
+        mode.puck.move()
+        OnePlayerMode.checkEdge(mode)
+        OnePlayerMode.checkScore(mode)
     
     def checkEdge(mode):
         #check if anyone scores and apply puckHitsEdge method
@@ -792,9 +1470,10 @@ class OnePlayerMode(Mode):
             instruction = "Go to the camera window,\n\
 hold the item you want to\n\
 use to control your mallet,\n\
-press 't' and select the item"
-            canvas.create_rectangle(mode.width/2-220, mode.height/2-100,
-                                    mode.width/2+220, mode.height/2+100,
+press 't' and select the item\n\
+or 'a' for aruco marker"
+            canvas.create_rectangle(mode.width/2-220, mode.height/2-125,
+                                    mode.width/2+220, mode.height/2+125,
                                     fill='white', outline='black', width=5)
             canvas.create_text(mode.width/2, mode.height/2, text=instruction,
                                font="Times 36")
@@ -891,6 +1570,17 @@ press 't' and select the item"
                     font=font, fill=mode.diffColor['Nightmare'], anchor='nw')
         canvas.create_text(mode.width/4, mode.height/4+400, text="CMU",
                         font=font, fill=mode.diffColor['CMU'], anchor='nw')
+        canvas.create_text(mode.width/4+220, mode.height/4+100, text="Predict",
+                    font=font, fill=mode.diffColor['Predict'], anchor='nw')
+        canvas.create_text(mode.width/4+220, mode.height/4+200, text="Search",
+                    font=font, fill=mode.diffColor['Search'], anchor='nw')
+        canvas.create_text(mode.width/4+220, mode.height/4+300, text="Table",
+                    font=font, fill=mode.diffColor['Table'], anchor='nw')
+        if not mode.tableReady:
+            canvas.create_text(mode.width/4+220, mode.height/4+340,
+                    text='build it first with\n'
+                         '"python3 airHockeyAI.py policy Table"',
+                    font="Times 14", fill='gray', anchor='nw')
         canvas.create_text(mode.width/4 * 3, mode.height/4, text="Hand:",
                            font=font)
         canvas.create_text(mode.width/4 * 3, mode.height/4+100, text="Left",
@@ -921,6 +1611,21 @@ press 't' and select the item"
         yInRange = y >= mode.height/4+400 and y <= mode.height/4+436
         return xInRange and yInRange
 
+    def inPredict(mode, x, y):
+        xInRange = x >= mode.width/4+220 and x <= mode.width/4+220 + 120
+        yInRange = y >= mode.height/4+100 and y <= mode.height/4+136
+        return xInRange and yInRange
+
+    def inSearch(mode, x, y):
+        xInRange = x >= mode.width/4+220 and x <= mode.width/4+220 + 115
+        yInRange = y >= mode.height/4+200 and y <= mode.height/4+236
+        return xInRange and yInRange
+
+    def inTable(mode, x, y):
+        xInRange = x >= mode.width/4+220 and x <= mode.width/4+220 + 100
+        yInRange = y >= mode.height/4+300 and y <= mode.height/4+336
+        return xInRange and yInRange
+
     def inLeft(mode, x, y):
         xInRange = x >= mode.width/4 * 3 and x <= mode.width/4 * 3 + 75
         yInRange = y >= mode.height/4+100 and y <= mode.height/4+136
@@ -967,29 +1672,42 @@ class PracticeMode(Mode):
         mode.friction = 0.5
         mode.lost = False
         mode.won = False
+        mode.grade = getattr(mode, 'grade', 0) #kept for the next level
         mode.timerDelay = 5  
 
     def trackStart(mode):
-        mode.cap = cv.VideoCapture(0)
-        mode.tracker = cv.TrackerCSRT_create()
+        if getattr(mode, 'cap', None) is not None:
+            mode.cap.release()
+        mode.cap = openSource(mode)
+        mode.mapper = mode.cap.makeMapper(mode.width, mode.height,
+                                          mode.app.quality.settings()[0])
+        mode.qualityLevel = mode.app.quality.level
+        mode.tracker = newTracker(mode)
         mode.tracked = False
+        mode.trackerTime = None #seconds the last tracker update took
         mode.bbox = None
     
     def selectStart(mode):
         #for pre-game interface
         if mode.hand != None:
+            #a verified level of the grade, ready without any wait
+            mode.seed, level = mode.app.levels.next(mode.grade)
             if mode.hand == 'Left':
                 mode.mallet = Mallet(50, mode.height/2, 0, 0)
                 mode.puck = Puck(mode.width/4, mode.height/2, 0, 0)
-                mode.rectangles = ([ Rectangle(mode.width/2 + i*64, 'Left',
-                                   mode.height) for i in range(0, 10) ])
+                mode.rectangles = ([ Rectangle(mode.width/2 + offset, 'Left',
+                                   mode.height, y, length)
+                                   for offset, y, length in level ])
             else:
                 mode.mallet = Mallet(mode.width-50, mode.height/2, 0, 0)
                 mode.puck = Puck(mode.width/4 * 3, mode.height/2, 0, 0)
-                mode.rectangles = ([ Rectangle(mode.width/2 - i*64, 'Right',
-                                   mode.height) for i in range(0, 10) ])
+                mode.rectangles = ([ Rectangle(mode.width/2 - offset, 'Right',
+                                   mode.height, y, length)
+                                   for offset, y, length in level ])
+            mode.targets = TargetIndex(mode.rectangles, mode.hand,
+                                       mode.height)
             mode.selected = True
-            #mode.rectangles is a list of 10 rectangle objects
+            #mode.rectangles is a list of rectangle objects
     
     def mouseMoved(mode, event):
         #mouse moved on clickables
@@ -1056,50 +1774,122 @@ class PracticeMode(Mode):
             if (event.x >= rX1 and event.x <= rX2 and 
                 event.y >= rY1 and event.y <= rY2):
                 mode.tracked = False
-                mode.tracker = cv.MultiTracker_create()
+                mode.tracker = newTracker(mode)
+                mode.mallet.lose()
     
     def keyPressed(mode, event):
         #start a new game
         if (mode.won or mode.lost) and event.key == 'n':
+            if mode.won:
+                #a cleared level moves on to a harder grade
+                mode.grade = min(mode.grade + 1, brickGrade)
             PracticeMode.appStarted(mode)
     
     #lines end with <-- are copied/modified from this youtube video:
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def setTracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (630, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
-        if cv.waitKey(1) == ord('t'):
+        mirroredFrame = mode.mapper.prepare(frame)
+        truthBoxes = mode.cap.truthBoxes(mode.mapper)
+        key = cameraKey(mode)
+        if key == ord('t'):
             mode.bbox = cv.selectROI('Tracking', mirroredFrame, False) #<--
+            mode.app.templates.remember(handPlayer(mode), mirroredFrame,
+                                        mode.bbox, mode.mapper.size)
+            #the selected item replaces an aruco or color tracker
+            mode.tracker = newTracker(mode)
             mode.tracker.init(mirroredFrame, mode.bbox) #<--
             mode.tracked = True
             mode.started = True
-        cv.imshow('Tracking', mirroredFrame) #<--
+        elif key == ord('k'):
+            #click the four table corners to calibrate an angled camera
+            mode.mapper.calibrate('Tracking', frame)
+            return
+        elif key == ord('a'):
+            #printed aruco marker 0, nothing to select
+            mode.bbox = None
+            mode.tracker = MotionGate(ArucoTracker(0))
+        elif key == ord('c'):
+            #red paddle, nothing to select
+            mode.bbox = None
+            mode.tracker = SingleColorTracker('red')
+        elif mode.cap.remote and mode.tracker.needsSelection:
+            #the vision process tracks the players, left one first
+            mode.bbox = None
+            mode.tracker = RemoteTrackers(mode.cap, handPlayer(mode))
+        elif truthBoxes is not None and mode.tracker.needsSelection:
+            #synthetic frames know where the objects are, nothing to select
+            if mode.hand == 'Left':
+                mode.bbox = truthBoxes[0]
+            else:
+                mode.bbox = truthBoxes[-1]
+            mode.tracker.init(mirroredFrame, mode.bbox)
+            mode.tracked = True
+            mode.started = True
+        elif (mode.tracker.needsSelection and
+              mode.app.templates.has(handPlayer(mode))):
+            #look for what was selected last time, nothing to select
+            bbox = mode.app.templates.find(handPlayer(mode), mirroredFrame,
+                                           mode.mapper.size)
+            if bbox is not None:
+                mode.bbox = bbox
+                mode.tracker.init(mirroredFrame, mode.bbox)
+                mode.tracked = True
+                mode.started = True
+        if not mode.tracker.needsSelection:
+            ret, bbox = mode.tracker.update(mirroredFrame)
+            if ret:
+                mode.bbox = bbox
+                mode.tracked = True
+                mode.started = True
+        showCamera(mode, mirroredFrame) #<--
     
     #lines end with <-- are copied/modified from this youtube video:
     #https://www.youtube.com/watch?v=O1ABXetrMGs
     def tracking(mode):
         ret, frame = mode.cap.read() #<--
-        sizedFrame = cv.resize(frame, (640, 360))
-        mirroredFrame = cv.flip(sizedFrame, +1)
-        ret, mode.bbox = mode.tracker.update(mirroredFrame) #<--
-        x, y = getMiddle(mode.bbox)
-        mode.mallet.dx = x * 2 - mode.mallet.x 
-        mode.mallet.dy = y * 2 - mode.mallet.y
-        mode.mallet.fixMalletSpeed()
+        mode.app.probe.start(mode.cap.captureTime)
+        if mode.qualityLevel != mode.app.quality.level:
+            PracticeMode.retune(mode, frame)
+        mirroredFrame = mode.mapper.prepare(frame)
+        mode.app.probe.mark('prepare')
+        start = time.perf_counter()
+        ret, bbox = mode.tracker.update(mirroredFrame) #<--
+        mode.trackerTime = time.perf_counter() - start
+        mode.app.probe.mark('track')
         if ret: #<--
+            #a lost track hands back an empty box, keep the last good one
+            mode.bbox = bbox
+            x, y = mode.mapper.toWindow(*getMiddle(mode.bbox))
+            mode.mallet.track(x, y, mode.cap.timestamp)
             drawBox(mirroredFrame, mode.bbox, 'red') #<--
         else:
             mode.tracked = False
-            mode.tracker = cv.TrackerCSRT_create()
+            mode.mallet.lose()
+            if mode.tracker.needsSelection:
+                mode.tracker = newTracker(mode)
             return
-        cv.imshow('Tracking', mirroredFrame) #<--
-        mode.mallet.move(x * 2, y * 2)
+        showCamera(mode, mirroredFrame) #<--
+        mode.mallet.move(x, y)
         if mode.hand == 'Left':
             mode.mallet.fixPosition(0, mode.width/2, mode.height)
         else:
             mode.mallet.fixPosition(mode.width/2, mode.width, mode.height)
     
+    def retune(mode, frame):
+        #follow the quality controller to another frame size or tracker
+        size, createTracker, maxStride = mode.app.quality.settings()
+        mode.bbox = scaleBox(mode.bbox, mode.mapper.size, size)
+        mode.mapper.resize(size)
+        if mode.tracker.needsSelection and emptyBox(mode.bbox):
+            #no good box to start the tracker from, select again
+            mode.tracker = newTracker(mode)
+            mode.tracked = False
+        else:
+            mode.tracker.retune(mode.mapper.prepare(frame), mode.bbox,
+                                createTracker, maxStride)
+        mode.qualityLevel = mode.app.quality.level
+
     def timerFired(mode):
         if not mode.selected:
             PracticeMode.selectStart(mode)
@@ -1107,14 +1897,15 @@ class PracticeMode(Mode):
             if not (mode.won or mode.lost) and not mode.tracked:
                 PracticeMode.setTracking(mode)
             elif not (mode.won or mode.lost) and mode.tracked:
+                mode.app.quality.tick()
                 PracticeMode.tracking(mode)
                 mode.puck.puckRebound(mode.mallet)
-                for rectangle in mode.rectangles:
-                    rectangle.puckHits(mode.puck)
+                mode.targets.puckHits(mode.puck)
                 mode.puck.applyFriction(mode.friction)
                 mode.puck.move()
                 PracticeMode.checkEdge(mode)
                 PracticeMode.checkWon(mode)
+                mode.app.probe.mark('physics')
     
     def checkEdge(mode):
         #check if puck flies out of the screen or stopped on the other side
@@ -1130,10 +1921,8 @@ class PracticeMode(Mode):
     
     def checkWon(mode):
         #won if all rectangles don't exist anymore
-        for rectangle in mode.rectangles:
-            if rectangle.exist:
-                return
-        mode.won = True
+        if mode.targets.remaining == 0:
+            mode.won = True
     
     def drawSelection(mode, canvas):
         font = "Times 36"
@@ -1167,9 +1956,10 @@ class PracticeMode(Mode):
             instruction = "Go to the camera window,\n\
 hold the item you want to\n\
 use to control your mallet,\n\
-press 't' and select the item"
-            canvas.create_rectangle(mode.width/2-220, mode.height/2-100,
-                                    mode.width/2+220, mode.height/2+100,
+press 't' and select the item\n\
+or 'a' for aruco marker"
+            canvas.create_rectangle(mode.width/2-220, mode.height/2-125,
+                                    mode.width/2+220, mode.height/2+125,
                                     fill='white', outline='black', width=5)
             canvas.create_text(mode.width/2, mode.height/2, text=instruction,
                                font="Times 36")
@@ -1186,6 +1976,11 @@ press 't' and select the item"
         canvas.create_text(retrackX, retrackY, text = 'Retrack', 
                 fill = mode.retrackColor, font = "Times 36", anchor = rAnchor)
     
+    def drawGrade(mode, canvas):
+        #the level and how many targets are left in it
+        canvas.create_text(mode.width/2, 10, font = "Arial 36", anchor = 'n',
+            text = f'Level {mode.grade + 1}   {mode.targets.remaining} left')
+    
     def drawRectangles(mode, canvas):
         #only draw rectangles that exist, i.e. rectangle.exist == True
         if mode.hand == 'Left':
@@ -1250,16 +2045,176 @@ press 't' and select the item"
             PracticeMode.drawPuck(mode, canvas)
             PracticeMode.drawDone(mode, canvas)
             PracticeMode.drawMenuRetrack(mode, canvas)
+            PracticeMode.drawGrade(mode, canvas)
             PracticeMode.drawWarning(mode, canvas)
             PracticeMode.drawInstruction(mode, canvas)
 
+class MatchReplay(object):
+    #A replay file played back on plain objects: every tick puts the
+    #mallets where the record says and runs the recorded mode's physics on
+    #them with the tick's seed, so it has the attributes the physics and
+    #the drawing of that mode use. diverged is the first tick whose pucks
+    #didn't match the recording, None while they all do.
+    def __init__(self, path):
+        header, self.records = readReplay(path)
+        self.kind = header['kind']
+        self.width, self.height = header['width'], header['height']
+        self.friction = header['friction']
+        self.leftMallet = Mallet(50, self.height/2, 0, 0)
+        self.rightMallet = Mallet(self.width-50, self.height/2, 0, 0)
+        if self.kind == 'Party':
+            PartyMode.rackPucks(self, header['pucks'], header['r'])
+        else:
+            self.puck = Puck(self.width/2, self.height/2, 0, 0, header['r'])
+            self.pucks = [self.puck]
+        self.rng = random.Random()
+        self.leftScore = 0
+        self.rightScore = 0
+        self.done = False
+        self.tick = 0
+        self.diverged = None
+        self.goals = [] #(tick, left score, right score)
+
+    def step(self):
+        #plays the next tick, False once the recording is over
+        if self.tick >= len(self.records):
+            return False
+        (tick, leftX, leftY, leftDx, leftDy, rightX, rightY, rightDx, rightDy,
+         seed, check) = self.records[self.tick]
+        if self.diverged is None and puckCheck(self.pucks) != check:
+            self.diverged = tick
+        left, right = self.leftMallet, self.rightMallet
+        left.x, left.y, left.dx, left.dy = leftX, leftY, leftDx, leftDy
+        right.x, right.y, right.dx, right.dy = rightX, rightY, rightDx, rightDy
+        self.rng.seed(seed)
+        scores = self.leftScore, self.rightScore
+        if self.kind == 'Party':
+            PartyMode.physics(self)
+        elif self.kind == 'OnePlayer':
+            OnePlayerMode.physics(self)
+        else:
+            TwoPlayerMode.physics(self)
+        if (self.leftScore, self.rightScore) != scores:
+            self.goals.append((tick, self.leftScore, self.rightScore))
+        self.tick += 1
+        return True
+
+class ReplayMode(Mode):
+    #Watches the app's replay file at the physics rate, space pauses and
+    #'n' starts it over. Drawn like two player mode.
+    def appStarted(mode):
+        mode.replay = MatchReplay(mode.app.replayPath)
+        mode.paused = False
+        mode.timerDelay = 1000 // physicsRate
+
+    def keyPressed(mode, event):
+        if event.key == 'Space':
+            mode.paused = not mode.paused
+        elif event.key == 'n':
+            ReplayMode.appStarted(mode)
+
+    def timerFired(mode):
+        if not mode.paused:
+            mode.replay.step()
+
+    def drawStatus(mode, canvas):
+        replay = mode.replay
+        status = f'Replay   tick {replay.tick} / {len(replay.records)}'
+        if mode.paused:
+            status += '   paused'
+        canvas.create_text(mode.width/2, mode.height-10, text=status,
+                           font="Arial 24", anchor='s')
+        if replay.diverged is not None:
+            canvas.create_text(mode.width/2, mode.height-50,
+                text=f'The physics went off the recording at tick '
+                     f'{replay.diverged}', fill='red', font="Arial 24",
+                anchor='s')
+
+    def redrawAll(mode, canvas):
+        replay = mode.replay
+        TwoPlayerMode.drawBoard(replay, canvas)
+        TwoPlayerMode.drawLeftMallet(replay, canvas)
+        PartyMode.drawPuck(replay, canvas)
+        TwoPlayerMode.drawRightMallet(replay, canvas)
+        TwoPlayerMode.drawScore(replay, canvas)
+        ReplayMode.drawStatus(mode, canvas)
+
 class MyModalApp(ModalApp):
+    def __init__(app, frameSource='camera', showCamera=True,
+                 replays=replaysDirectory, replayPath=None, **kwargs):
+        #frameSource is a spec for openFrameSource, the webcam by default,
+        #showCamera=False runs without the opencv camera window. Matches are
+        #recorded to the replays directory unless it is None, replayPath
+        #plays a replay file back instead of starting the game.
+        app.frameSource = frameSource
+        app.showCamera = showCamera
+        app.replays = replays
+        app.replayPath = replayPath
+        super().__init__(**kwargs)
+
     def appStarted(app):
+        app.probe = LatencyProbe()
+        app.input = InputState()
+        app.quality = QualityController()
+        app.templates = TrackerTemplates()
+        app.levels = PracticeLevels(app.width, app.height)
         app.splashScreenMode = SplashScreenMode()
         app.onePlayerMode = OnePlayerMode()
         app.twoPlayerMode = TwoPlayerMode()
         app.practiceMode = PracticeMode()
-        app.setActiveMode(app.splashScreenMode)
+        app.partyMode = PartyMode()
+        app.replayMode = ReplayMode()
+        app.replayWriter = None
+        if app.replayPath is not None:
+            app.setActiveMode(app.replayMode)
+        else:
+            if app.replays is not None:
+                app.replayWriter = ReplayWriter()
+            app.setActiveMode(app.splashScreenMode)
         app.timerDelay = 5
 
-app = MyModalApp(width=1280, height=720)
\ No newline at end of file
+    def mouseMoved(app, event):
+        app.input.mouseMoved(event.x, event.y)
+        super().mouseMoved(event)
+
+    def mouseDragged(app, event):
+        app.input.mouseMoved(event.x, event.y)
+        super().mouseDragged(event)
+
+    def keyPressed(app, event):
+        app.input.keyPressed(event.key)
+        super().keyPressed(event)
+
+    def keyReleased(app, event):
+        app.input.keyReleased(event.key)
+        super().keyReleased(event)
+
+    def _redrawAllWrapper(app):
+        #the frame the last tick used is on screen once cmu_112_graphics has
+        #drawn and updated the canvas, the probe is finished out here since
+        #redrawAll may not change the app's state
+        super()._redrawAllWrapper()
+        app.probe.finish()
+
+    def appStopped(app):
+        super().appStopped()
+        for mode in [app.onePlayerMode, app.twoPlayerMode, app.practiceMode,
+                     app.partyMode]:
+            if getattr(mode, 'cap', None) is not None:
+                mode.cap.release()
+            stopRecording(mode)
+        if app.replayWriter is not None:
+            app.replayWriter.close()
+        print(app.probe.formatReport())
+
+if __name__ == '__main__':
+    #python3 opencvAirHockey.py [frame source], e.g. synthetic, video:path
+    #or mouse and keys to play without a camera, or
+    #python3 opencvAirHockey.py replay path to watch a recorded match
+    if sys.argv[1:2] == ['replay'] and len(sys.argv) > 2:
+        app = MyModalApp(width=1280, height=720, showCamera=False,
+                         replayPath=sys.argv[2])
+    else:
+        frameSource = sys.argv[1] if len(sys.argv) > 1 else 'camera'
+        app = MyModalApp(width=1280, height=720, frameSource=frameSource,
+                         showCamera=frameSource not in controls)
\ No newline at end of file